@@ -0,0 +1,94 @@
+"""
+Throughput of serializing a page of 1000 contacts, as GET /contacts/contacts/ does after the query.
+
+before: the previous response models (orm_mode, EmailStr), built from the ORM __dict__ and rendered by JSONResponse
+after:  ORM objects validated once from attributes by the response_model and rendered by ORJSONResponse
+
+Run from the project root: python -m benchmarks.contacts_serialization
+"""
+import asyncio
+import time
+from datetime import date, datetime
+from typing import List, Optional
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import BaseModel, EmailStr
+
+from src.database.models import ContactModel, User
+from src.schemas import ContactPage, UserResponse
+
+CONTACTS = 1000
+ROUNDS = 50
+
+
+class LegacyContactResponse(BaseModel):
+    id: int = 1
+    first_name: str
+    second_name: str
+    email: EmailStr
+    phone: str
+    birth_date: date
+    created_at: datetime
+    updated_at: datetime
+    user: UserResponse
+
+    class Config:
+        orm_mode = True
+
+
+class LegacyContactPage(BaseModel):
+    items: List[LegacyContactResponse]
+    next_cursor: Optional[str] = None
+
+
+def make_contacts() -> list[ContactModel]:
+    user = User(id=1, username="deadpool", email="deadpool@example.com", avatar="https://example.com/avatar.png")
+    now = datetime.now()
+    return [ContactModel(id=n, first_name=f"First{n}", second_name=f"Second{n}", email=f"c{n}@example.com",
+                         phone=f"+38050{n:07d}", birth_date=date(1990, n % 12 + 1, n % 28 + 1), created_at=now,
+                         updated_at=now, user_id=1, user=user)
+            for n in range(CONTACTS)]
+
+
+async def before(field, contacts) -> bytes:
+    items = [LegacyContactResponse.model_validate(contact.__dict__, from_attributes=True) for contact in contacts]
+    content = await serialize_response(field=field, response_content=LegacyContactPage(items=items))
+    return JSONResponse(content).body
+
+
+async def after(field, contacts) -> bytes:
+    content = await serialize_response(field=field, response_content={"items": contacts, "next_cursor": None})
+    return ORJSONResponse(content).body
+
+
+async def best_of(func, *args) -> float:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        await func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def main():
+    legacy_field = create_response_field(name="Response_list_contacts", type_=LegacyContactPage, mode="serialization")
+    field = create_response_field(name="Response_list_contacts", type_=ContactPage, mode="serialization")
+    contacts = make_contacts()
+    assert (await before(legacy_field, contacts)).replace(b" ", b"") == await after(field, contacts)
+
+    for name, func, response_field in (("before", before, legacy_field), ("after", after, field)):
+        best = await best_of(func, response_field, contacts)
+        print(f"{name:7} {best * 1000:7.2f} ms/page  {CONTACTS / best:10.0f} contacts/s")
+
+    content = await serialize_response(field=field, response_content={"items": contacts, "next_cursor": None})
+    for response_class in (JSONResponse, ORJSONResponse):
+        async def render():
+            return response_class(content).body
+        best = await best_of(render)
+        print(f"render only, {response_class.__name__:14} {best * 1000:7.2f} ms/page")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
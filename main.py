@@ -1,19 +1,19 @@
 import dotenv
 import uvicorn
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from ipaddress import ip_address
-from fastapi.responses import JSONResponse
-from src.database.db import get_db
+from fastapi.responses import ORJSONResponse
+from src.database.db import get_db, pool_metrics
 from src.routes import contacts, auth, users
 from fastapi_limiter import FastAPILimiter
 from src.conf.config import settings
-import redis.asyncio as redis
+from src.services.cache import redis_client, redis_pool, user_cache
+from src.services.auth import auth_service
+from src.services.ip_allowlist import IPAllowlistMiddleware
 from starlette.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Depends, HTTPException, Request, status
-from typing import Callable
+from fastapi import FastAPI, Depends, HTTPException
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 
 @app.on_event("startup")
@@ -26,8 +26,28 @@ such as connecting to databases or initializing caches.
 :return: A list of coroutines to run
 :doc-author: Trelent
 """
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
-    await FastAPILimiter.init(r)
+    await FastAPILimiter.init(redis_client)
+    user_cache.start()
+    auth_service.revocations.start()
+    if settings.password_hash_target_ms:
+        await auth_service.calibrate_hashing(settings.password_hash_target_ms, settings.password_hash_rounds,
+                                             settings.password_hash_max_rounds)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+The shutdown function is called when the application stops.
+It stops the user cache invalidation listener, the revocation list sync and the password hashing pool,
+and closes the connections of the shared Redis pool.
+
+:return: None
+:doc-author: Trelent
+"""
+    await user_cache.stop()
+    await auth_service.revocations.stop()
+    auth_service.hash_executor.shutdown()
+    await redis_pool.disconnect()
 
 
 app.add_middleware(
@@ -38,25 +58,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-ALLOWED_IPS = [ip_address('192.168.1.0'), ip_address('172.16.0.0'), ip_address("127.0.0.1")]
-
-
-@app.middleware("http")
-async def limit_access_by_ip(request: Request, call_next: Callable):
-    """
-The limit_access_by_ip function is a middleware function that limits access to the API by IP address.
-It checks if the client's IP address is in ALLOWED_IPS, and if not, returns a 403 Forbidden response.
-
-:param request: Request: Get the client's ip address
-:param call_next: Callable: Pass the next function in the chain
-:return: A jsonresponse object with a status code of 403 and a detail message
-:doc-author: Trelent
-"""
-    ip = ip_address(request.client.host)
-    if ip not in ALLOWED_IPS:
-        return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "Not allowed IP address"})
-    response = await call_next(request)
-    return response
+app.add_middleware(
+    IPAllowlistMiddleware,
+    allowed=settings.allowed_ips,
+    trusted_proxies=settings.trusted_proxies,
+    cache_size=settings.ip_allowlist_cache_size,
+)
 
 
 @app.get("/")
@@ -71,19 +78,19 @@ The root function returns a JSON object with the message &quot;Hello World&quot;
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     """
 The healthchecker function is a simple function that checks the health of the database.
 It does this by making a request to the database and checking if it returns any results.
 If there are no results, then we know something is wrong with our connection.
 
-:param db: Session: Get the database session
+:param db: AsyncSession: Get the database session
 :return: A dictionary with a message
 :doc-author: Trelent
 """
     try:
         # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
+        result = (await db.execute(text("SELECT 1"))).fetchone()
         if result is None:
             raise HTTPException(status_code=500, detail="Database is not configured correctly")
         return {"message": "Welcome to FastAPI!"}
@@ -92,6 +99,33 @@ If there are no results, then we know something is wrong with our connection.
         raise HTTPException(status_code=500, detail="Error connecting to the database")
 
 
+@app.get("/api/metrics")
+async def metrics():
+    """
+The metrics function is an internal endpoint that exposes runtime counters of the service,
+such as the database connection pool usage, the per-worker hit rates of the user and token caches
+and the queue depth of the password hashing pool.
+
+:return: A dictionary with the metrics of every subsystem
+:doc-author: Trelent
+"""
+    return {"db_pool": pool_metrics(), "user_cache": user_cache.stats(),
+            "token_cache": auth_service.token_cache.stats(), "revocation": auth_service.revocations.stats(),
+            "password_hash": auth_service.hash_executor.metrics()}
+
+
+@app.get("/.well-known/jwks.json")
+async def jwks():
+    """
+The jwks function publishes the public keys that verify the tokens of the service,
+so other services can verify them locally. Clients may cache the set for a few minutes.
+
+:return: A JSON Web Key Set
+:doc-author: Trelent
+"""
+    return ORJSONResponse(auth_service.jwks(), headers={"Cache-Control": "public, max-age=300"})
+
+
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
@@ -0,0 +1,32 @@
+"""add contacts birth_mmdd
+
+Revision ID: 3db657bb958f
+Revises: 
+Create Date: 2026-10-17 18:40:12.402913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3db657bb958f'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column(
+        'birth_mmdd', sa.Integer(),
+        sa.Computed('CAST(EXTRACT(month FROM birth_date) * 100 + EXTRACT(day FROM birth_date) AS INTEGER)',
+                    persisted=True),
+    ))
+    op.create_index('ix_contacts_user_id_birth_mmdd', 'contacts', ['user_id', 'birth_mmdd'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birth_mmdd', table_name='contacts')
+    op.drop_column('contacts', 'birth_mmdd')
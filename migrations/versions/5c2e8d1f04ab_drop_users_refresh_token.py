@@ -0,0 +1,27 @@
+"""drop users refresh_token
+
+Revision ID: 5c2e8d1f04ab
+Revises: ea7a3b7b4128
+Create Date: 2026-10-17 21:14:05.402817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e8d1f04ab'
+down_revision: Union[str, None] = 'ea7a3b7b4128'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Refresh tokens live in the Redis refresh token store, the column is no longer written
+    op.drop_column('users', 'refresh_token')
+
+
+def downgrade() -> None:
+    op.add_column('users', sa.Column('refresh_token', sa.String(length=255), nullable=True))
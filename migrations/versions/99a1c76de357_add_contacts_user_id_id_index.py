@@ -0,0 +1,26 @@
+"""add contacts (user_id, id) index
+
+Revision ID: 99a1c76de357
+Revises: 3db657bb958f
+Create Date: 2026-10-17 19:02:41.118350
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '99a1c76de357'
+down_revision: Union[str, None] = '3db657bb958f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
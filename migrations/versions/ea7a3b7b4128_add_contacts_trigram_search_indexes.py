@@ -0,0 +1,34 @@
+"""add contacts trigram search indexes
+
+Revision ID: ea7a3b7b4128
+Revises: eddbeec23a6d
+Create Date: 2026-10-17 19:02:30.667007
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ea7a3b7b4128'
+down_revision: Union[str, None] = 'eddbeec23a6d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = ('first_name', 'second_name', 'email', 'phone')
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+    for column in SEARCH_COLUMNS:
+        op.create_index(f'ix_contacts_user_id_{column}_trgm', 'contacts', ['user_id', column], unique=False,
+                        postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    # The extensions are left installed, other objects of the database may use them
+    for column in SEARCH_COLUMNS:
+        op.drop_index(f'ix_contacts_user_id_{column}_trgm', table_name='contacts', postgresql_using='gin')
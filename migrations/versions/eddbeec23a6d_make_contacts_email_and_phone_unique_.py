@@ -0,0 +1,36 @@
+"""make contacts email and phone unique per user
+
+Revision ID: eddbeec23a6d
+Revises: f946abcd3526
+Create Date: 2026-10-17 18:59:11.251904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'eddbeec23a6d'
+down_revision: Union[str, None] = 'f946abcd3526'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNIQUE_COLUMNS = ('email', 'phone')
+
+
+def upgrade() -> None:
+    # The per-user unique constraints replace both the global unique indexes and the (user_id, column) lookup indexes
+    for column in UNIQUE_COLUMNS:
+        op.drop_index(f'ix_contacts_{column}', table_name='contacts')
+        op.drop_index(f'ix_contacts_user_id_{column}', table_name='contacts')
+        op.create_unique_constraint(f'uq_contacts_user_id_{column}', 'contacts', ['user_id', column])
+
+
+def downgrade() -> None:
+    # Fails if two users share a contact email or phone
+    for column in UNIQUE_COLUMNS:
+        op.drop_constraint(f'uq_contacts_user_id_{column}', 'contacts', type_='unique')
+        op.create_index(f'ix_contacts_user_id_{column}', 'contacts', ['user_id', column], unique=False)
+        op.create_index(f'ix_contacts_{column}', 'contacts', [column], unique=True)
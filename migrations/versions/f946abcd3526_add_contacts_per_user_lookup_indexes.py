@@ -0,0 +1,30 @@
+"""add contacts per-user lookup indexes
+
+Revision ID: f946abcd3526
+Revises: 99a1c76de357
+Create Date: 2026-10-17 19:21:07.530214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f946abcd3526'
+down_revision: Union[str, None] = '99a1c76de357'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LOOKUP_COLUMNS = ('email', 'phone', 'first_name', 'second_name', 'birth_date')
+
+
+def upgrade() -> None:
+    for column in LOOKUP_COLUMNS:
+        op.create_index(f'ix_contacts_user_id_{column}', 'contacts', ['user_id', column], unique=False)
+
+
+def downgrade() -> None:
+    for column in LOOKUP_COLUMNS:
+        op.drop_index(f'ix_contacts_user_id_{column}', table_name='contacts')
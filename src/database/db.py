@@ -1,30 +1,64 @@
-import configparser
-import pathlib
-
-from fastapi import HTTPException, status
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from fastapi import HTTPException, Request, status
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from src.conf.config import settings
+from src.database.pool import InstrumentedPool
+from src.database.instrumentation import instrument, current_route
 
 URI = settings.sqlalchemy_database_url
 
-engine = create_engine(URI, echo=True)
-DBSession = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+engine = create_async_engine(
+    URI,
+    echo=settings.db_echo,
+    poolclass=InstrumentedPool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+instrument(engine.sync_engine)
+DBSession = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+def record_route(request: Request) -> None:
+    """
+The record_route function tags the statements run while serving the request with its method and matched route,
+so slow statements in the query log can be traced back to their endpoint.
+
+:param request: Request: Get the route that is being served
+:return: None
+:doc-author: Trelent
+"""
+    route = request.scope.get("route")
+    current_route.set(f"{request.method} {getattr(route, 'path', request.url.path)}")
 
 
-def get_db():
+async def get_db(request: Request):
     """
-The get_db function is a context manager that will automatically close the database session at the end of a request.
+The get_db function is an async dependency that will automatically close the database session at the end of a request.
 It also handles any exceptions that occur during the request, and aborts with an HTTP 400 error if one occurs.
+The matched route is recorded for the query log, so slow statements can be traced back to their endpoint.
+
+:param request: Request: Get the route that is being served
+:return: An AsyncSession, which is used by all the functions that need to query the database
+:doc-author: Trelent
+"""
+    record_route(request)
+    async with DBSession() as db:
+        try:
+            yield db
+        except SQLAlchemyError as err:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+
+
+def pool_metrics() -> dict:
+    """
+The pool_metrics function reports the live state of the engine connection pool:
+checked-out, idle and overflow connections plus the time checkouts spent waiting.
 
-:return: A database connection, which is used by all the functions that need to query the database
+:return: A dictionary with the pool counters
 :doc-author: Trelent
 """
-    db = DBSession()
-    try:
-        yield db
-    except SQLAlchemyError as err:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
-    finally:
-        db.close()
+    return engine.pool.metrics()
@@ -0,0 +1,76 @@
+import json
+import logging
+import random
+import re
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import settings
+
+logger = logging.getLogger("src.database.queries")
+
+current_route: ContextVar[str | None] = ContextVar("current_route", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\((?:\s*(?:\$\d+|\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\$\d+|\?|%\(\w+\)s|:\w+)\s*\)")
+
+
+def normalize_sql(statement: str) -> str:
+    """
+The normalize_sql function turns a statement into its fingerprint, so that the same query
+shape is logged the same way whatever the values and the length of its IN lists are.
+Literals are replaced with ?, parameter lists are collapsed to (...) and whitespace is squashed.
+
+:param statement: str: The SQL text sent to the driver
+:return: The normalized SQL
+:doc-author: Trelent
+"""
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _PARAM_LIST.sub("(...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+    slow = duration_ms >= settings.db_slow_query_ms
+    if not slow and random.random() >= settings.db_query_sample_rate:
+        return
+    record = {
+        "event": "slow_query" if slow else "sampled_query",
+        "sql": normalize_sql(statement),
+        "duration_ms": round(duration_ms, 3),
+        "rows": cursor.rowcount,
+        "executemany": executemany,
+        "route": current_route.get(),
+    }
+    logger.log(logging.WARNING if slow else logging.INFO, json.dumps(record))
+
+
+def _handle_error(exception_context):
+    if exception_context.connection is not None and exception_context.connection.info.get("query_start_time"):
+        exception_context.connection.info["query_start_time"].pop()
+
+
+def instrument(engine: Engine) -> None:
+    """
+The instrument function attaches the query timing hooks to an engine. Only statements slower than
+settings.db_slow_query_ms are always logged, the rest are logged with probability settings.db_query_sample_rate.
+For an AsyncEngine pass its sync_engine.
+
+:param engine: Engine: The engine to instrument
+:return: None
+:doc-author: Trelent
+"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, func, ForeignKey, Boolean
+from sqlalchemy import (Column, Integer, String, Date, DateTime, func, ForeignKey, Boolean, Computed, Index, cast, extract,
+                        UniqueConstraint, DDL, event)
 from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.ext.asyncio import AsyncAttrs
 
-Base = declarative_base()
+Base = declarative_base(cls=AsyncAttrs)
 
 
 class ContactModel(Base):
@@ -9,14 +11,42 @@ class ContactModel(Base):
     id = Column(Integer, primary_key=True, index=True)
     first_name = Column(String, nullable=False)
     second_name = Column(String, nullable=False)
-    email = Column(String, unique=True, index=True, nullable=False)
-    phone = Column(String, unique=True, index=True, nullable=False)
+    email = Column(String, nullable=False)
+    phone = Column(String, nullable=False)
     birth_date = Column(Date, nullable=False)
+    birth_mmdd = Column(Integer, Computed(cast(extract('month', birth_date) * 100 + extract('day', birth_date), Integer),
+                                          persisted=True))
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     user = relationship("User", backref="contacts")
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        Index("ix_contacts_user_id_birth_mmdd", "user_id", "birth_mmdd"),
+        Index("ix_contacts_user_id_id", "user_id", "id"),
+        # Emails and phones are unique per user; the constraints also serve the lookups by email and phone
+        UniqueConstraint("user_id", "email", name="uq_contacts_user_id_email"),
+        UniqueConstraint("user_id", "phone", name="uq_contacts_user_id_phone"),
+        Index("ix_contacts_user_id_first_name", "user_id", "first_name"),
+        Index("ix_contacts_user_id_second_name", "user_id", "second_name"),
+        Index("ix_contacts_user_id_birth_date", "user_id", "birth_date"),
+        # Trigram indexes of the contact search, for prefix ILIKE and the pg_trgm similarity operator.
+        # btree_gin puts user_id in the same GIN index, so a search only reads the entries of its user
+        Index("ix_contacts_user_id_first_name_trgm", "user_id", "first_name", postgresql_using="gin",
+              postgresql_ops={"first_name": "gin_trgm_ops"}),
+        Index("ix_contacts_user_id_second_name_trgm", "user_id", "second_name", postgresql_using="gin",
+              postgresql_ops={"second_name": "gin_trgm_ops"}),
+        Index("ix_contacts_user_id_email_trgm", "user_id", "email", postgresql_using="gin",
+              postgresql_ops={"email": "gin_trgm_ops"}),
+        Index("ix_contacts_user_id_phone_trgm", "user_id", "phone", postgresql_using="gin",
+              postgresql_ops={"phone": "gin_trgm_ops"}),
+    )
+
+
+for extension in ("pg_trgm", "btree_gin"):
+    event.listen(Base.metadata, "before_create",
+                 DDL(f"CREATE EXTENSION IF NOT EXISTS {extension}").execute_if(dialect="postgresql"))
+
 
 class User(Base):
     __tablename__ = "users"
@@ -24,6 +54,5 @@ class User(Base):
     username = Column(String(50))
     email = Column(String(150), nullable=False, unique=True)
     password = Column(String(255), nullable=False)
-    refresh_token = Column(String(255), nullable=True)
     avatar = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
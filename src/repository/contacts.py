@@ -1,26 +1,48 @@
+import calendar
 from datetime import date
+from typing import AsyncIterable, AsyncIterator, Sequence
 from src.database.models import ContactModel, User
-from src.schemas import ContactModel
-from sqlalchemy.orm import Session
-from sqlalchemy import extract, and_
+from src import schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import (select, and_, or_, case, Row, Table, MetaData, Column, Integer, String, Date, func, exists,
+                        literal, literal_column, bindparam, any_)
+from sqlalchemy.dialects.postgresql import insert as pg_insert, ARRAY
+from sqlalchemy.orm import selectinload
 
 
-async def get_contacts(limit: int, offset: int, user: User, db: Session):
+def _select_contacts():
+    # Contacts are always serialized with their owner, load it in one extra query per statement instead of one per row
+    return select(ContactModel).options(selectinload(ContactModel.user))
+
+
+CONTACT_FIELDS = ("first_name", "second_name", "email", "phone", "birth_date")
+EXPORT_COLUMNS = ("id", "first_name", "second_name", "email", "phone", "birth_date", "created_at", "updated_at")
+
+
+async def get_contacts(limit: int, offset: int, user: User, db: AsyncSession, after_id: int | None = None):
     """
-The get_contacts function returns a list of contacts for the user.
+The get_contacts function returns a list of contacts for the user, ordered by id, with their owner eagerly loaded.
+When after_id is given the page starts right after that contact (keyset pagination) and offset is ignored,
+so every page is a range scan of the (user_id, id) index no matter how deep it is.
 
 :param limit: int: Limit the number of contacts returned
 :param offset: int: Skip a certain number of contacts
 :param user: User: Get the user id from the database
-:param db: Session: Access the database
+:param db: AsyncSession: Access the database
+:param after_id: int | None: The id of the last contact of the previous page
 :return: A list of contacts
 :doc-author: Trelent
 """
-    contacts = db.query(ContactModel).filter(ContactModel.user_id == user.id).limit(limit).offset(offset).all()
-    return contacts
+    stmt = _select_contacts().filter(ContactModel.user_id == user.id).order_by(ContactModel.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.filter(ContactModel.id > after_id)
+    else:
+        stmt = stmt.offset(offset)
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
 
 
-async def get_contact_by_id(contact_id: int, user: User, db: Session):
+async def get_contact_by_id(contact_id: int, user: User, db: AsyncSession):
     """
 The get_contact_by_id function takes in a contact_id and user, and returns the contact with that id.
     Args:
@@ -29,15 +51,16 @@ The get_contact_by_id function takes in a contact_id and user, and returns the c
 
 :param contact_id: int: Specify the id of the contact that is being retrieved
 :param user: User: Get the user id from the user object
-:param db: Session: Pass a database session to the function
+:param db: AsyncSession: Pass a database session to the function
 :return: The contact with the given id
 :doc-author: Trelent
 """
-    contact = db.query(ContactModel).filter(and_(ContactModel.id == contact_id, ContactModel.user_id == user.id)).first()
-    return contact
+    stmt = _select_contacts().filter(and_(ContactModel.id == contact_id, ContactModel.user_id == user.id))
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
 
 
-async def get_contact_by_email(email: str, user: User, db: Session):
+async def get_contact_by_email(email: str, user: User, db: AsyncSession):
     """
 The get_contact_by_email function takes in an email and a user, and returns the contact with that email.
     Args:
@@ -46,15 +69,16 @@ The get_contact_by_email function takes in an email and a user, and returns the
 
 :param email: str: Pass in the email of the contact we want to find
 :param user: User: Identify the user that is making the request
-:param db: Session: Pass the database session to the function
+:param db: AsyncSession: Pass the database session to the function
 :return: The contact with the given email and user
 :doc-author: Trelent
 """
-    contact = db.query(ContactModel).filter(and_(ContactModel.email == email, ContactModel.user_id == user.id)).first()
-    return contact
+    stmt = _select_contacts().filter(and_(ContactModel.email == email, ContactModel.user_id == user.id))
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
 
 
-async def get_contact_by_phone(phone: str, user: User, db: Session):
+async def get_contact_by_phone(phone: str, user: User, db: AsyncSession):
     """
 The get_contact_by_phone function takes in a phone number and user object,
 and returns the contact associated with that phone number.
@@ -62,80 +86,111 @@ and returns the contact associated with that phone number.
 
 :param phone: str: Get the phone number of a contact
 :param user: User: Filter the contacts by user
-:param db: Session: Access the database
+:param db: AsyncSession: Access the database
 :return: A contact object
 :doc-author: Trelent
 """
-    contact = db.query(ContactModel).filter(and_(ContactModel.phone == phone, ContactModel.user_id == user.id)).first()
-    return contact
+    stmt = _select_contacts().filter(and_(ContactModel.phone == phone, ContactModel.user_id == user.id))
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
 
 
-async def get_contact_by_first_name(first_name: str, user: User, db: Session):
+async def get_contact_by_first_name(first_name: str, user: User, db: AsyncSession):
     """
 The get_contact_by_first_name function takes in a first_name and user object, and returns the contact with that
 first name. If no such contact exists, it returns None.
 
 :param first_name: str: Filter the database for contacts with a matching first name
 :param user: User: Identify the user who is making the request
-:param db: Session: Pass the database session to the function
+:param db: AsyncSession: Pass the database session to the function
 :return: A contact object
 :doc-author: Trelent
 """
-    contact = db.query(ContactModel).filter(and_(ContactModel.first_name == first_name, ContactModel.user_id == user.id)).first()
-    return contact
+    stmt = _select_contacts().filter(and_(ContactModel.first_name == first_name, ContactModel.user_id == user.id))
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
 
 
-async def get_contact_by_second_name(second_name: str, user: User, db: Session):
+async def get_contact_by_second_name(second_name: str, user: User, db: AsyncSession):
     """
 The get_contact_by_second_name function returns a contact by second name.
 
 :param second_name: str: Filter the contacts by second name
 :param user: User: Get the user's id from the database
-:param db: Session: Access the database
+:param db: AsyncSession: Access the database
 :return: The first contact with the specified second name
 :doc-author: Trelent
 """
-    contact = db.query(ContactModel).filter(and_(ContactModel.second_name == second_name, ContactModel.user_id == user.id)).first()
-    return contact
+    stmt = _select_contacts().filter(and_(ContactModel.second_name == second_name, ContactModel.user_id == user.id))
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
 
 
-async def get_contact_by_birth_date(birth_date: date, user: User, db: Session):
+async def get_contact_by_birth_date(birth_date: date, user: User, db: AsyncSession):
     """
 The get_contact_by_birth_date function returns a contact object from the database based on the birth_date parameter.
     The function takes in three parameters:
         - birth_date: A date object representing the birthday of a contact.
         - user: A User object representing an authenticated user. This is used to ensure that only contacts belonging to this user are returned by this function.
-        - db: An SQLAlchemy Session instance, which is used for querying and updating data in our database.
+        - db: An SQLAlchemy AsyncSession instance, which is used for querying and updating data in our database.
 
 :param birth_date: date: Filter the contacts by birth date
 :param user: User: Get the user_id from the user object
-:param db: Session: Pass a database session to the function
+:param db: AsyncSession: Pass a database session to the function
 :return: The contact with the specified birth date and user id
 :doc-author: Trelent
 """
-    contact = db.query(ContactModel).filter(and_(ContactModel.birth_date == birth_date, ContactModel.user_id == user.id)).first()
-    return contact
+    stmt = _select_contacts().filter(and_(ContactModel.birth_date == birth_date, ContactModel.user_id == user.id))
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
 
 
-async def create(body: ContactModel, current_user: User, db: Session):
+async def create(body: schemas.ContactModel, current_user: User, db: AsyncSession):
     """
 The create function creates a new contact in the database.
 
 
-:param body: ContactModel: Get the data from the request body
+:param body: schemas.ContactModel: Get the data from the request body
 :param current_user: User: Check if the user is authenticated
-:param db: Session: Pass the database session to the function
+:param db: AsyncSession: Pass the database session to the function
 :return: The contact model
 :doc-author: Trelent
 """
-    contact = ContactModel(**body.dict(), user=current_user)
+    contact = ContactModel(**body.dict(exclude={"user_id"}), user_id=current_user.id)
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
+    await db.refresh(contact)
+    return contact
+
+
+def _on_conflict_update(stmt):
+    # A contact is identified by its email within the user's contacts, sending it again updates it
+    return stmt.on_conflict_do_update(
+        constraint="uq_contacts_user_id_email",
+        set_={**{field: stmt.excluded[field] for field in CONTACT_FIELDS if field != "email"},
+              "updated_at": func.now()},
+    )
+
+
+async def upsert(body: schemas.ContactCreateUpdate, user: User, db: AsyncSession):
+    """
+The upsert function creates a contact, or updates the contact of the user with the same email,
+in a single INSERT ... ON CONFLICT (user_id, email) DO UPDATE statement, so sending the same contact
+twice is idempotent and concurrent requests cannot race between a lookup and an insert.
+
+:param body: schemas.ContactCreateUpdate: Get the data from the request body
+:param user: User: Get the user id from the user object
+:param db: AsyncSession: Access the database
+:return: The created or updated contact
+:doc-author: Trelent
+"""
+    stmt = _on_conflict_update(pg_insert(ContactModel).values(**body.model_dump(), user_id=user.id))
+    contact = await db.scalar(stmt.returning(ContactModel), execution_options={"populate_existing": True})
+    await db.commit()
     return contact
 
 
-async def update(contact_id: int, body: ContactModel, user: User, db: Session):
+async def update(contact_id: int, body: schemas.ContactModel, user: User, db: AsyncSession):
     """
 The update function updates a contact in the database.
     Args:
@@ -143,9 +198,9 @@ The update function updates a contact in the database.
         body (ContactModel): The updated information for the specified user.
 
 :param contact_id: int: Identify the contact to be deleted
-:param body: ContactModel: Pass the data from the request body to the function
+:param body: schemas.ContactModel: Pass the data from the request body to the function
 :param user: User: Get the user_id from the token
-:param db: Session: Access the database
+:param db: AsyncSession: Access the database
 :return: The updated contact
 :doc-author: Trelent
 """
@@ -156,49 +211,257 @@ The update function updates a contact in the database.
         contact.email = body.email
         contact.phone = body.phone
         contact.birth_date = body.birth_date
-        db.commit()
+        await db.commit()
+        await db.refresh(contact, ["updated_at"])
     return contact
 
 
-async def remove(contact_id: int, user: User, db: Session):
+async def remove(contact_id: int, user: User, db: AsyncSession):
     """
 The remove function removes a contact from the database.
     Args:
         contact_id (int): The id of the contact to be removed.
         user (User): The user who is removing the contact.
-        db (Session): A connection to our database, used for querying and updating data.
+        db (AsyncSession): A connection to our database, used for querying and updating data.
 
 :param contact_id: int: Specify the id of the contact to be removed
 :param user: User: Check if the user is logged in
-:param db: Session: Pass the database session to the function
+:param db: AsyncSession: Pass the database session to the function
 :return: The contact that was removed, if it exists
 :doc-author: Trelent
 """
     contact = await get_contact_by_id(contact_id, user, db)
     if contact:
-        db.delete(contact)
-        db.commit()
+        await db.delete(contact)
+        await db.commit()
     return contact
 
 
-async def get_contacts_birthday(start_date: date, end_date: date, db: Session):
+def _mmdd(day: date) -> int:
+    return day.month * 100 + day.day
+
+
+async def get_contacts_birthday(start_date: date, end_date: date, user: User, db: AsyncSession):
     """
-The get_contacts_birthday function returns a list of contacts whose birthdays fall between the start_date and end_date.
-The function takes in three parameters:
+The get_contacts_birthday function returns the contacts of the user whose birthdays fall between the start_date
+and end_date, ordered by the upcoming date. Birthdays are compared on the persisted birth_mmdd column
+(month * 100 + day), so the whole window is a range scan of the (user_id, birth_mmdd) index. A window that crosses the new year is split into two ranges,
+and on non-leap years February 29 birthdays are celebrated on March 1.
+The function takes in four parameters:
     - start_date: The first date to check for birthdays (inclusive)
-    - end_date: The last date to check for birthdays (inclusive)
+    - end_date: The last date to check for birthdays (inclusive), at most a year after start_date
+    - user: The owner of the contacts
     - db: A database session object that is used to query the database.  This parameter is automatically passed by FastAPI when you use dependency injection.
 
 :param start_date: date: Set the start date of the range
 :param end_date: date: Set the end date of the range
-:param db: Session: Pass the database session to the function
+:param user: User: Get the user id from the user object
+:param db: AsyncSession: Pass the database session to the function
 :return: A list of contacts whose birthdays are between the start date and end date
 :doc-author: Trelent
 """
-    birth_day = extract('day', ContactModel.birth_date)
-    birth_month = extract('month', ContactModel.birth_date)
-    contacts = db.query(ContactModel).filter(
-        birth_month == extract('month', start_date),
-        birth_day.between(extract('day', start_date), extract('day', end_date))
-    ).all()
-    return contacts
+    birth_mmdd = ContactModel.birth_mmdd
+    start, end = _mmdd(start_date), _mmdd(end_date)
+    if start == 301 and not calendar.isleap(start_date.year):
+        start = 229
+    if start <= end:
+        window = birth_mmdd.between(start, end)
+    else:
+        window = or_(birth_mmdd >= start, birth_mmdd <= end)
+    stmt = _select_contacts().filter(ContactModel.user_id == user.id, window).order_by(
+        case((birth_mmdd >= start, 0), else_=1), birth_mmdd, ContactModel.id
+    )
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
+
+
+SEARCH_COLUMNS = (ContactModel.first_name, ContactModel.second_name, ContactModel.email, ContactModel.phone)
+
+
+async def search_contacts(query: str, limit: int, offset: int, user: User, db: AsyncSession):
+    """
+The search_contacts function finds the contacts of the user whose first name, second name, email or phone
+starts with the query (case-insensitive) or is similar to it according to pg_trgm (PostgreSQL only).
+Prefix matches come first, then the contacts are ranked by their best trigram similarity to the query.
+Both kinds of match are served by the (user_id, column) trigram GIN index of every column.
+
+:param query: str: The text to search for
+:param limit: int: Limit the number of contacts returned
+:param offset: int: Skip a certain number of contacts
+:param user: User: Get the user id from the user object
+:param db: AsyncSession: Access the database
+:return: A list of contacts, best matches first
+:doc-author: Trelent
+"""
+    prefix = or_(*(column.istartswith(query, autoescape=True) for column in SEARCH_COLUMNS))
+    similar = or_(*(column.op("%")(query) for column in SEARCH_COLUMNS))
+    similarity = func.greatest(*(func.similarity(column, query) for column in SEARCH_COLUMNS))
+    stmt = (
+        _select_contacts()
+        .filter(ContactModel.user_id == user.id, or_(prefix, similar))
+        .order_by(prefix.desc(), similarity.desc(), ContactModel.id)
+        .limit(limit)
+        .offset(offset)
+    )
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
+
+
+async def stream_contacts(user: User, db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[Sequence[Row]]:
+    """
+The stream_contacts function yields all contacts of the user, ordered by id, in batches of batch_size rows.
+The rows are read through a server-side cursor and only hold the EXPORT_COLUMNS, so memory stays flat
+however many contacts the user has.
+
+:param user: User: Get the user id from the database
+:param db: AsyncSession: Access the database
+:param batch_size: int: The number of rows fetched from the cursor at a time
+:return: An async iterator of batches of rows
+:doc-author: Trelent
+"""
+    stmt = (
+        select(*(getattr(ContactModel, column) for column in EXPORT_COLUMNS))
+        .filter(ContactModel.user_id == user.id)
+        .order_by(ContactModel.id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
+
+
+async def apply_batch(operations: Sequence[schemas.ContactOperation], user: User, db: AsyncSession) -> list[dict]:
+    """
+The apply_batch function applies a batch of create, update and delete operations to the contacts of the user
+in a single transaction, with one statement per kind of operation:
+deletes run first as one DELETE ... WHERE id = ANY(...), then the updates of the contacts the user owns
+as one executemany UPDATE, then the creates as one multi-row upsert, so a batch may hand the email
+of a deleted contact to a new one. A create with the email of an existing contact of the user updates it.
+An update or delete of a contact the user does not own is reported as not_found;
+an integrity error rolls back the whole batch.
+
+:param operations: Sequence[schemas.ContactOperation]: The operations, each contact at most once
+:param user: User: Get the user id from the user object
+:param db: AsyncSession: Access the database
+:return: One result per operation, in the order of the operations
+:doc-author: Trelent
+"""
+    contacts = ContactModel.__table__
+    results = [{"index": index, "op": operation.op, "id": operation.id, "status": "not_found"}
+               for index, operation in enumerate(operations)]
+    deletes = [result for result in results if result["op"] == "delete"]
+    updates = [result for result in results if result["op"] == "update"]
+    creates = [result for result in results if result["op"] == "create"]
+
+    if deletes:
+        deleted = await db.execute(
+            contacts.delete()
+            .where(contacts.c.id == any_(literal([result["id"] for result in deletes], ARRAY(Integer))),
+                   contacts.c.user_id == user.id)
+            .returning(contacts.c.id)
+        )
+        deleted_ids = set(deleted.scalars().all())
+        for result in deletes:
+            if result["id"] in deleted_ids:
+                result["status"] = "deleted"
+
+    if updates:
+        owned = await db.execute(
+            select(contacts.c.id)
+            .where(contacts.c.id.in_([result["id"] for result in updates]), contacts.c.user_id == user.id)
+            .with_for_update()
+        )
+        owned_ids = set(owned.scalars().all())
+        updates = [result for result in updates if result["id"] in owned_ids]
+        if updates:
+            await db.execute(
+                contacts.update()
+                .where(contacts.c.id == bindparam("contact_id"))
+                .values(**{field: bindparam(field) for field in CONTACT_FIELDS}, updated_at=func.now()),
+                [{"contact_id": result["id"], **operations[result["index"]].contact.model_dump()}
+                 for result in updates],
+            )
+            for result in updates:
+                result["status"] = "updated"
+
+    if creates:
+        created = await db.execute(
+            _on_conflict_update(pg_insert(contacts)).returning(contacts.c.email, contacts.c.id,
+                                                               literal_column("xmax = 0")),
+            [{**operations[result["index"]].contact.model_dump(), "user_id": user.id} for result in creates],
+        )
+        # The emails of the creates are distinct, so they match the returned rows to the operations
+        created_ids = {email: (contact_id, inserted) for email, contact_id, inserted in created.all()}
+        for result in creates:
+            contact_id, inserted = created_ids[operations[result["index"]].contact.email]
+            result.update(id=contact_id, status="created" if inserted else "updated")
+
+    await db.commit()
+    return results
+
+
+# Rows of a bulk import are copied here first and upserted into contacts in one statement
+contacts_import = Table(
+    "contacts_import",
+    MetaData(),
+    Column("line", Integer, nullable=False),
+    Column("first_name", String, nullable=False),
+    Column("second_name", String, nullable=False),
+    Column("email", String, nullable=False),
+    Column("phone", String, nullable=False),
+    Column("birth_date", Date, nullable=False),
+    Column("status", String),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+async def import_contacts(records: AsyncIterable[tuple], user: User, db: AsyncSession,
+                          max_conflicts: int = 100) -> dict:
+    """
+The import_contacts function loads validated records into the contacts of the user (PostgreSQL only).
+The records are streamed with COPY FROM STDIN into a temporary staging table that is dropped on commit,
+then upserted by email in a single INSERT ... SELECT: a new email creates a contact, an email the user
+already has updates it. A row whose phone is already used by another contact of the user
+is left out and reported as a conflict.
+Every record must carry the fields of IMPORT_COLUMNS in order, and no email or phone may repeat.
+
+:param records: AsyncIterable[tuple]: The records (line, first_name, second_name, email, phone, birth_date)
+:param user: User: Get the user id from the user object
+:param db: AsyncSession: Access the database
+:param max_conflicts: int: The number of conflicting line numbers to report
+:return: A dictionary with the created, updated and conflicting counts and the first conflicting lines
+:doc-author: Trelent
+"""
+    staging = contacts_import
+    conn = await db.connection()
+    await conn.run_sync(staging.create)
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        staging.name, records=records, columns=[column.name for column in staging.columns if column.name != "status"]
+    )
+
+    phone_taken = exists().where(ContactModel.user_id == user.id, ContactModel.phone == staging.c.phone,
+                                 ContactModel.email != staging.c.email)
+    stmt = pg_insert(ContactModel).from_select(
+        ["first_name", "second_name", "email", "phone", "birth_date", "user_id"],
+        select(staging.c.first_name, staging.c.second_name, staging.c.email, staging.c.phone, staging.c.birth_date,
+               literal(user.id)).where(~phone_taken),
+    )
+    upserted = _on_conflict_update(stmt).returning(
+        ContactModel.email, literal_column("xmax = 0").label("created")
+    ).cte("upserted")
+    await db.execute(
+        staging.update()
+        .values(status=case((upserted.c.created, "created"), else_="updated"))
+        .where(staging.c.email == upserted.c.email)
+    )
+
+    counts = dict((await db.execute(select(staging.c.status, func.count()).group_by(staging.c.status))).all())
+    conflicts = await db.execute(
+        select(staging.c.line).where(staging.c.status.is_(None)).order_by(staging.c.line).limit(max_conflicts)
+    )
+    conflict_lines = conflicts.scalars().all()
+    await db.commit()
+    return {"created": counts.get("created", 0), "updated": counts.get("updated", 0),
+            "conflicts": counts.get(None, 0), "conflict_lines": conflict_lines}
@@ -1,89 +1,111 @@
 from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
+from src.services.cache import user_cache, CachedUser
 
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
+async def get_user_by_email(email: str, db: AsyncSession) -> User | None:
     """
 The get_user_by_email function takes in an email and a database session,
 and returns the user with that email if it exists. If no such user exists,
 it returns None.
 
 :param email: str: Specify the email address of the user
-:param db: Session: Pass the database session to the function
+:param db: AsyncSession: Pass the database session to the function
 :return: A single user by email
 :doc-author: Trelent
 """
-    return db.query(User).filter_by(email=email).first()
+    user = await db.execute(select(User).filter_by(email=email))
+    return user.scalars().first()
 
 
-async def create_user(body: UserModel, db: Session):
+async def _commit_user(user: User, db: AsyncSession) -> None:
+    """
+The _commit_user function commits the changes of a user and keeps the cached principal in step with the database.
+The cached entry is evicted before the commit, so a failure to reach Redis aborts the change
+instead of leaving a stale principal behind; the committed state is written through afterwards.
+Both steps move the generation of the user on, so a request that loaded the old row in between
+cannot put it back into the cache.
+
+:param user: User: The changed user
+:param db: AsyncSession: Pass the database session to the function
+:return: None
+:doc-author: Trelent
+"""
+    await user_cache.evict(user.email)
+    await db.commit()
+    await user_cache.write_through(CachedUser.from_user(user))
+
+
+async def create_user(body: UserModel, db: AsyncSession):
     """
 The create_user function creates a new user in the database.
     Args:
         body (UserModel): The UserModel object to be created.
-        db (Session): The SQLAlchemy session object used for querying the database.
+        db (AsyncSession): The SQLAlchemy session object used for querying the database.
 
 :param body: UserModel: Pass the data from the request body to the function
-:param db: Session: Create a database session
+:param db: AsyncSession: Create a database session
 :return: A new user object, which is then passed to the response
 :doc-author: Trelent
 """
     grav = Gravatar(body.email)
     new_user = User(**body.dict(), avatar=grav.get_image())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, refresh_token, db: Session):
-    """
-The update_token function updates the refresh token for a user in the database.
-    Args:
-        user (User): The User object to update.
-        refresh_token (str): The new refresh token to store in the database.
-        db (Session): A connection to our Postgres database.
-
-:param user: User: Get the user's id from the database
-:param refresh_token: Update the user's refresh token in the database
-:param db: Session: Pass the database session to the function
-:return: Nothing
-:doc-author: Trelent
-"""
-    user.refresh_token = refresh_token
-    db.commit()
-
-
-async def confirmed_email(email: str, db: Session) -> None:
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
 The confirmed_email function takes in an email and a database session,
 and sets the confirmed field of the user with that email to True.
 
 
 :param email: str: Get the user's email
-:param db: Session: Pass the database connection to the function
+:param db: AsyncSession: Pass the database connection to the function
 :return: None
 :doc-author: Trelent
 """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await _commit_user(user, db)
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+async def update_avatar(email, url: str, db: AsyncSession) -> User:
     """
 The update_avatar function updates the avatar of a user.
 
 :param email: Find the user in the database
 :param url: str: Specify the type of parameter that is being passed into the function
-:param db: Session: Pass the database session to the function
+:param db: AsyncSession: Pass the database session to the function
 :return: A user object
 :doc-author: Trelent
 """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await _commit_user(user, db)
     return user
+
+
+async def update_password(email: str, old_password: str, new_password: str, db: AsyncSession) -> bool:
+    """
+The update_password function replaces the password hash of a user.
+The hash is only replaced if it is still old_password, so a password changed in the meantime is not overwritten.
+
+:param email: str: Find the user in the database
+:param old_password: str: The hash that is expected to be stored
+:param new_password: str: The new hash
+:param db: AsyncSession: Pass the database session to the function
+:return: True if the hash was replaced
+:doc-author: Trelent
+"""
+    result = await db.execute(
+        update(User).where(User.email == email, User.password == old_password).values(password=new_password)
+    )
+    await db.commit()
+    return result.rowcount == 1
@@ -2,7 +2,7 @@ from typing import List
 
 from fastapi import Depends, HTTPException, status, APIRouter, Security, BackgroundTasks, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
@@ -17,7 +17,7 @@ security = HTTPBearer()
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED,
              dependencies=[Depends(RateLimiter(times=1, seconds=10))])
-async def signup(body: UserModel, background_task: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, background_task: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
     """
 The signup function creates a new user in the database.
     It takes in a UserModel object, which is validated by pydantic.
@@ -27,28 +27,31 @@ The signup function creates a new user in the database.
 :param body: UserModel: Get the user information from the request body
 :param background_task: BackgroundTasks: Add a task to the background tasks queue
 :param request: Request: Get the base url of the request
-:param db: Session: Get the database session
+:param db: AsyncSession: Get the database session
 :return: The newly created user, but it also sends an email to the new user
 :doc-author: Trelent
 """
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
     background_task.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
     return new_user
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(background_task: BackgroundTasks, body: OAuth2PasswordRequestForm = Depends(),
+                db: AsyncSession = Depends(get_db)):
     """
 The login function is used to authenticate a user.
     It takes the username and password from the request body,
     verifies them against the database, and returns an access token if successful.
+    A password hashed with an outdated cost is hashed again in the background.
 
+:param background_task: BackgroundTasks: Add a task to the background tasks queue
 :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-:param db: Session: Get the database session
+:param db: AsyncSession: Get the database session
 :return: A dictionary with the access_token, refresh_token and token type
 :doc-author: Trelent
 """
@@ -57,42 +60,61 @@ The login function is used to authenticate a user.
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email is not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if auth_service.needs_rehash(user.password):
+        background_task.add_task(auth_service.rehash_password, user.email, body.password, user.password)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    family, refresh_token = await auth_service.issue_refresh_token(user.email)
+    access_token = await auth_service.create_access_token(data={"sub": user.email, "fam": family})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security)):
     """
 The refresh_token function is used to refresh the access token.
     The function takes in a refresh token and returns an access_token, a new refresh_token, and the type of token.
-    If the user's current refresh_token does not match what was passed into this function then it will return an error.
+    Every refresh token can be used only once; reusing one revokes the session it belongs to.
 
 :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
-:param db: Session: Create a database session
 :return: A new access_token and refresh_token
 :doc-author: Trelent
 """
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
+    email, family, refresh_token = await auth_service.rotate_refresh_token(credentials.credentials)
+    access_token = await auth_service.create_access_token(data={"sub": email, "fam": family})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.post('/logout')
+async def logout(token: str = Depends(auth_service.oauth2_scheme)):
+    """
+The logout function revokes the access token of the request and ends the session it belongs to.
+
+:param token: str: Get the access token from the request header
+:return: A message that the user was logged out
+:doc-author: Trelent
+"""
+    await auth_service.logout(token)
+    return {"message": "Logged out"}
+
+
+@router.post('/logout_all')
+async def logout_all(token: str = Depends(auth_service.oauth2_scheme)):
+    """
+The logout_all function revokes the access token of the request and ends every session of the user,
+e.g. when a device was lost.
+
+:param token: str: Get the access token from the request header
+:return: A message that the user was logged out of all sessions
+:doc-author: Trelent
+"""
+    await auth_service.logout_all(token)
+    return {"message": "Logged out of all sessions"}
+
+
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
 The confirmed_email function is used to confirm a user's email address.
     It takes the token from the URL and uses it to get the user's email address.
@@ -102,7 +124,7 @@ The confirmed_email function is used to confirm a user's email address.
     by setting &quot;confirmed&quot; to True and then return another success message.
 
 :param token: str: Get the token from the url
-:param db: Session: Get the database session
+:param db: AsyncSession: Get the database session
 :return: A message that the email is already confirmed or a message that the email was confirmed
 :doc-author: Trelent
 """
@@ -118,7 +140,7 @@ The confirmed_email function is used to confirm a user's email address.
 
 @router.post('/request_email')
 async def request_email(body: RequestEmail, background_task: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+                        db: AsyncSession = Depends(get_db)):
     """
 The request_email function is used to send an email to the user with a link that will confirm their account.
     The function takes in a RequestEmail object, which contains the user's email address. It then checks if there
@@ -129,7 +151,7 @@ The request_email function is used to send an email to the user with a link that
 :param body: RequestEmail: Get the email from the request body
 :param background_task: BackgroundTasks: Add a task to the background tasks queue
 :param request: Request: Get the base_url of the server
-:param db: Session: Get the database session
+:param db: AsyncSession: Get the database session
 :return: A message to the user, but it also adds a task to the background_task object
 :doc-author: Trelent
 """
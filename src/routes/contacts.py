@@ -1,15 +1,23 @@
+import csv
 from datetime import date, timedelta, datetime
-from typing import List
+from typing import List, Literal
 
-from fastapi import Depends, HTTPException, Path, status, APIRouter, Query
-from sqlalchemy import extract
-from sqlalchemy.orm import Session
+from fastapi import Depends, HTTPException, Path, status, APIRouter, Query, Request, UploadFile, File
+from fastapi.routing import APIRoute
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
-from src.database.models import User, Contact
+from src.conf.config import settings
+from src.database.db import get_db, record_route, DBSession
+from src.database.models import User, ContactModel as Contact
 from src.repository import contacts as repository_contacts
-from src.schemas import ContactModel, ContactResponse, ContactCreateUpdate
+from src.schemas import (ContactModel, ContactResponse, ContactCreateUpdate, ContactPage, ContactImportReport,
+                         ContactBatch, ContactBatchResponse)
 from src.services.auth import auth_service
+from src.services.pagination import encode_cursor, decode_cursor
+from src.services.export import ndjson_chunks, csv_chunks
+from src.services.contact_import import ContactValidator, validated_records
 from fastapi_limiter.depends import RateLimiter
 
 router = APIRouter(prefix="/contacts", tags=['contacts'])
@@ -18,58 +26,239 @@ router = APIRouter(prefix="/contacts", tags=['contacts'])
 
 
 
+@router.get("/contacts/", response_model=ContactPage)
+async def list_contacts(
+        limit: int = Query(10, ge=1, le=100),
+        offset: int = Query(0, ge=0),
+        cursor: str | None = Query(None),
+        db: AsyncSession = Depends(get_db),
+        current_user: User = Depends(auth_service.get_current_user)
+):
+    """
+The list_contacts function returns a page of the user's contacts ordered by id.
+Pass the next_cursor of a page as cursor to get the following page; every page then costs the same
+however deep it is. Without a cursor the legacy offset paging is used.
+
+:param limit: int: The number of contacts on a page
+:param offset: int: Skip a certain number of contacts, ignored when a cursor is given
+:param cursor: str: The next_cursor returned with the previous page
+:param db: AsyncSession: Access the database
+:param current_user: User: Get the current user
+:return: A contactpage object with the contacts and the cursor of the next page
+:doc-author: Trelent
+"""
+    after_id = decode_cursor(cursor) if cursor is not None else None
+    contacts = await repository_contacts.get_contacts(limit + 1, offset, current_user, db, after_id=after_id)
+    next_cursor = encode_cursor(contacts[limit - 1].id) if len(contacts) > limit else None
+    return {"items": contacts[:limit], "next_cursor": next_cursor}
+
+
 @router.post("/contacts/", response_model=ContactResponse)
-def create_contact(
+async def create_contact(
         contact: ContactCreateUpdate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user: Contact = Depends(auth_service.get_current_user)
 ):
     """
 The create_contact function creates a new contact in the database.
+If the user already has a contact with the same email, that contact is updated instead,
+so a client can safely send the same contact again. A phone used by another contact of the user is a 409.
 
 :param contact: ContactCreateUpdate: Pass in the contact information
-:param db: Session: Access the database
+:param db: AsyncSession: Access the database
 :param current_user: Contact: Get the current user from the database
 :return: A contactresponse object
 :doc-author: Trelent
 """
-    db_contact = Contact(**contact.dict(), user_id=current_user.id)
-    db.add(db_contact)
-    db.commit()
-    db.refresh(db_contact)
-    return ContactResponse(**db_contact.__dict__)
+    try:
+        db_contact = await repository_contacts.upsert(contact, current_user, db)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact with this phone already exists")
+    await db_contact.awaitable_attrs.user
+    return db_contact
 
 
 @router.get("/upcoming_birthdays/", response_model=List[ContactResponse])
-def upcoming_birthdays(db: Session = Depends(get_db)):
+async def upcoming_birthdays(db: AsyncSession = Depends(get_db),
+                             current_user: User = Depends(auth_service.get_current_user)):
     """
-The upcoming_birthdays function returns a list of contacts with birthdays in the next week.
+The upcoming_birthdays function returns a list of the user's contacts with birthdays in the next week,
+ordered by the upcoming date.
 
-:param db: Session: Access the database
+:param db: AsyncSession: Access the database
+:param current_user: User: Get the current user
 :return: A list of contactresponse objects
 :doc-author: Trelent
 """
-    today = datetime.now().date()
+    today = date.today()
     next_week = today + timedelta(days=7)
 
-    contacts = []
+    contacts = await repository_contacts.get_contacts_birthday(today, next_week, current_user, db)
+
+    return contacts
+
+
+@router.get("/search", response_model=List[ContactResponse])
+async def search_contacts(q: str = Query(min_length=1, max_length=100),
+                          limit: int = Query(10, ge=1, le=100),
+                          offset: int = Query(0, ge=0),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+The search_contacts function returns a page of the user's contacts matching q by first name, second name,
+email or phone. Contacts where one of them starts with q come first, the others are fuzzy matches
+ordered by how similar they are to q, so a typo in a name still finds the contact.
+
+:param q: str: The text to search for
+:param limit: int: The number of contacts on a page
+:param offset: int: Skip a certain number of contacts
+:param db: AsyncSession: Access the database
+:param current_user: User: Get the current user
+:return: A list of contactresponse objects, best matches first
+:doc-author: Trelent
+"""
+    return await repository_contacts.search_contacts(q, limit, offset, current_user, db)
+
+
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_chunks, "application/x-ndjson"),
+    "csv": (csv_chunks, "text/csv"),
+}
+
+
+async def _export_chunks(fmt: str, user: User, request: Request):
+    # The session of get_db is closed before a streaming body is sent, so the export opens its own
+    encode, _ = EXPORT_FORMATS[fmt]
+    record_route(request)
+    async with DBSession() as db:
+        async for chunk in encode(repository_contacts.stream_contacts(user, db), repository_contacts.EXPORT_COLUMNS):
+            yield chunk
+
+
+@router.get("/export")
+async def export_contacts(request: Request, fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+The export_contacts function streams all contacts of the user as NDJSON or CSV.
+The rows are read from a server-side cursor and sent batch by batch, so the first bytes go out right away
+and memory stays flat however many contacts the user has.
+
+:param request: Request: Get the route for the query log of the export session
+:param fmt: str: The format of the export, ndjson or csv
+:param current_user: User: Get the current user
+:return: A streamingresponse with the contacts
+:doc-author: Trelent
+"""
+    _, media_type = EXPORT_FORMATS[fmt]
+    return StreamingResponse(_export_chunks(fmt, current_user, request), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{fmt}"'})
+
+
+@router.post("/batch", response_model=ContactBatchResponse)
+async def batch_contacts(body: ContactBatch, db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
+    """
+The batch_contacts function applies a list of create, update and delete operations in one transaction,
+so a client pushing many changes at once costs one request and one commit.
+Each operation gets a result with the id of its contact and its status; an operation on a contact
+the user does not own is not_found, a create of a contact the user already has updates it.
+If an operation conflicts with another contact, e.g. on its phone, nothing is applied and the batch answers 409.
+
+:param body: ContactBatch: The operations, each contact at most once
+:param db: AsyncSession: Access the database
+:param current_user: User: Get the current user
+:return: A contactbatchresponse object with one result per operation
+:doc-author: Trelent
+"""
+    try:
+        results = await repository_contacts.apply_batch(body.operations, current_user, db)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Contact with this email or phone already exists")
+    return {"results": results}
+
+
+class UploadLimitRoute(APIRoute):
+    """
+The UploadLimitRoute refuses request bodies larger than import_max_bytes with status code 413
+before the form is parsed, so an oversized upload is never spooled to disk.
+A Content-Length over the limit is refused right away; the received bytes are counted as well,
+for chunked bodies and clients that send more than they announced.
 
-    for single_day in (today + timedelta(days=n) for n in range(8)):
-        day_contacts = db.query(Contact).filter(
-            extract('month', Contact.birthday) == single_day.month,
-            extract('day', Contact.birthday) == single_day.day
-        ).all()
-        contacts.extend(day_contacts)
+:doc-author: Trelent
+"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def limited_handler(request: Request):
+            max_bytes = settings.import_max_bytes
+            too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                      detail=f"The file is larger than {max_bytes} bytes")
+            content_length = request.headers.get("content-length", "")
+            if content_length.isdigit() and int(content_length) > max_bytes:
+                raise too_large
+            received = 0
+
+            async def receive():
+                nonlocal received
+                message = await request.receive()
+                if message["type"] == "http.request":
+                    received += len(message.get("body", b""))
+                    if received > max_bytes:
+                        raise too_large
+                return message
+
+            return await handler(Request(request.scope, receive))
+
+        return limited_handler
+
+
+async def import_contacts(file: UploadFile = File(),
+                          fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+The import_contacts function loads an uploaded CSV or NDJSON file into the contacts of the user.
+Every row is validated like the body of create_contact; the valid rows are copied into the database in bulk
+and upserted by email, so an existing contact of the user is updated instead of duplicated.
+Rows that fail validation or conflict with another contact are rejected and reported with their line numbers.
+Uploads larger than import_max_bytes are refused by UploadLimitRoute before the form is parsed,
+files with more than import_max_rows rows while they are read; both with status code 413.
+
+:param file: UploadFile: The file with the contacts, with a header line when it is a CSV
+:param fmt: str: The format of the file, ndjson or csv
+:param db: AsyncSession: Access the database
+:param current_user: User: Get the current user
+:return: A contactimportreport object with the counts and the errors of the rejected rows
+:doc-author: Trelent
+"""
+    validator = ContactValidator(max_rows=settings.import_max_rows)
+    try:
+        result = await repository_contacts.import_contacts(validated_records(file.file, fmt, validator),
+                                                           current_user, db)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid {fmt} file: {e}")
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="A phone of the file was taken by another contact during the import, try again")
+    report = validator.report
+    report.created, report.updated = result["created"], result["updated"]
+    report.add_conflicts(result["conflict_lines"], result["conflicts"])
+    return report
 
-    unique_contacts = list(set(contacts))
 
-    return [ContactResponse(**contact.__dict__) for contact in unique_contacts]
+router.add_api_route("/import", import_contacts, methods=["POST"], response_model=ContactImportReport,
+                     route_class_override=UploadLimitRoute)
 
 
 @router.get("/contacts/{contact_id}", response_model=ContactResponse)
-def get_contact(
+async def get_contact(
         contact_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user: Contact = Depends(auth_service.get_current_user)
 ):
     """
@@ -79,22 +268,22 @@ If no such contact exists, then an HTTPException is raised with status code 404
 Otherwise, if the user does exist in the database, then their information will be returned.
 
 :param contact_id: int: Specify the id of the contact to be retrieved
-:param db: Session: Get the database session
+:param db: AsyncSession: Get the database session
 :param current_user: Contact: Get the current user
 :return: A contactresponse object, which is the same as a contact object but without the user_id attribute
 :doc-author: Trelent
 """
-    contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == current_user.id).first()
+    contact = await repository_contacts.get_contact_by_id(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return ContactResponse(**contact.__dict__)
+    return contact
 
 
 @router.put("/contacts/{contact_id}", response_model=ContactResponse)
-def update_contact(
+async def update_contact(
         contact_id: int,
         contact: ContactCreateUpdate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user: Contact = Depends(auth_service.get_current_user)
 ):
     """
@@ -106,39 +295,33 @@ The update_contact function updates a contact in the database.
 
 :param contact_id: int: Identify the contact to be updated
 :param contact: ContactCreateUpdate: Pass the contact data to update
-:param db: Session: Get the database session
+:param db: AsyncSession: Get the database session
 :param current_user: Contact: Get the current user from the database
 :return: A contactresponse object
 :doc-author: Trelent
 """
-    db_contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == current_user.id).first()
+    db_contact = await repository_contacts.update(contact_id, contact, current_user, db)
     if db_contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
-    for key, value in contact.dict().items():
-        setattr(db_contact, key, value)
-    db.commit()
-    db.refresh(db_contact)
-    return ContactResponse(**db_contact.__dict__)
+    return db_contact
 
 
 @router.delete("/contacts/{contact_id}", response_model=ContactResponse)
-def delete_contact(
+async def delete_contact(
         contact_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user: Contact = Depends(auth_service.get_current_user)
 ):
     """
 The delete_contact function deletes a contact from the database.
 
 :param contact_id: int: Specify the id of the contact that will be deleted
-:param db: Session: Get a database session
+:param db: AsyncSession: Get a database session
 :param current_user: Contact: Get the currently logged in user
 :return: A contactresponse object
 :doc-author: Trelent
 """
-    db_contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == current_user.id).first()
+    db_contact = await repository_contacts.remove(contact_id, current_user, db)
     if db_contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
-    db.delete(db_contact)
-    db.commit()
-    return ContactResponse(**db_contact.__dict__)
\ No newline at end of file
+    return db_contact
\ No newline at end of file
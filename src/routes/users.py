@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
@@ -27,13 +27,13 @@ The read_users_me function is a GET endpoint that returns the current user's inf
 @router.patch('/avatar', response_model=UserResponse)
 async def update_avatar_user(file: UploadFile = File(),
                              current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     """
 The update_avatar_user function updates the avatar of a user.
 
 :param file: UploadFile: Receive the file from the client
 :param current_user: User: Get the current user and
-:param db: Session: Access the database
+:param db: AsyncSession: Access the database
 :return: A user object
 :doc-author: Trelent
 """
@@ -1,6 +1,7 @@
 from datetime import datetime, date
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, model_validator
 
 
 class ContactModel(BaseModel):
@@ -15,37 +16,99 @@ class ContactModel(BaseModel):
 
 
 class UserResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     username: str
     email: str
     avatar: str
 
-    class Config:
-        orm_mode = True
-
 
 class ContactResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int = 1
     first_name: str
     second_name: str
-    email: EmailStr
+    email: str
     phone: str
     birth_date: date
     created_at: datetime
     updated_at: datetime
     user: UserResponse
 
-    class Config:
-        orm_mode = True
+
+class ContactPage(BaseModel):
+    items: List[ContactResponse]
+    next_cursor: Optional[str] = None
 
 
 class ContactCreateUpdate(BaseModel):
     first_name: str
-    last_name: str
-    email: str
-    phone_number: str
-    birthday: datetime
-    additional_data: str = None
+    second_name: str
+    email: EmailStr
+    phone: str
+    birth_date: date
+
+
+class ContactOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = Field(None, gt=0)
+    contact: Optional[ContactCreateUpdate] = None
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.op != "create" and self.id is None:
+            raise ValueError(f"{self.op} needs the id of the contact")
+        if self.op != "delete" and self.contact is None:
+            raise ValueError(f"{self.op} needs the contact")
+        return self
+
+
+class ContactBatch(BaseModel):
+    operations: List[ContactOperation] = Field(min_length=1, max_length=1000)
+
+    @model_validator(mode="after")
+    def check_ids(self):
+        ids, emails, phones = set(), set(), set()
+        for index, operation in enumerate(self.operations):
+            if operation.id is not None:
+                if operation.id in ids:
+                    raise ValueError(f"Operation {index}: a contact can only appear once in a batch")
+                ids.add(operation.id)
+            if operation.op == "create":
+                if operation.contact.email in emails:
+                    raise ValueError(f"Operation {index}: a contact can only appear once in a batch")
+                emails.add(operation.contact.email)
+            if operation.contact is not None:
+                if operation.contact.phone in phones:
+                    raise ValueError(f"Operation {index}: the phone is already used by another operation of the batch")
+                phones.add(operation.contact.phone)
+        return self
+
+
+class ContactOperationResult(BaseModel):
+    index: int
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = None
+    status: Literal["created", "updated", "deleted", "not_found"]
+
+
+class ContactBatchResponse(BaseModel):
+    results: List[ContactOperationResult]
+
+
+class ImportRowError(BaseModel):
+    line: int
+    errors: List[str]
+
+
+class ContactImportReport(BaseModel):
+    received: int
+    created: int
+    updated: int
+    rejected: int
+    errors: List[ImportRowError]
 
 
 class UserModel(BaseModel):
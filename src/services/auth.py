@@ -1,31 +1,85 @@
+import hashlib
+import logging
+import time
+import uuid
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 
-import redis
-import pickle
 from fastapi import Depends, HTTPException, status
 from passlib.context import CryptContext
+from passlib.hash import bcrypt
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 
-from src.database.db import get_db
+from src.database.db import get_db, DBSession
 from src.repository import users as repository_users
 from src.conf.config import settings
+from src.services.cache import redis_client, user_cache, CachedUser
+from src.services.executor import BoundedExecutor
+from src.services.jwt_keys import KeyRing
+from src.services.lru import TTLCache
+from src.services.refresh_tokens import RefreshTokenStore, Rotation
+from src.services.revocation import RevocationList
+
+logger = logging.getLogger(__name__)
+
+
+def _make_pwd_context(rounds: int) -> CryptContext:
+    # min_rounds makes needs_update flag the hashes with a lower cost, so logins upgrade them
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds,
+                        bcrypt__min_rounds=rounds)
+
+
+def _calibrate_rounds(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    rounds = min_rounds
+    for candidate in range(min_rounds, max_rounds + 1):
+        started = time.perf_counter()
+        bcrypt.using(rounds=candidate).hash("calibration")
+        if (time.perf_counter() - started) * 1000 > target_ms:
+            break
+        rounds = candidate
+    return rounds
+
+
+class AccessClaims(NamedTuple):
+    sub: str
+    scope: str
+    exp: float
+    jti: str | None
+    fam: str | None
+
+
+def _load_key_ring() -> KeyRing | None:
+    # HS* algorithms keep signing with the shared SECRET_KEY
+    if settings.algorithm.startswith("HS"):
+        return None
+    return KeyRing.from_directory(settings.jwt_keys_dir, settings.algorithm, settings.jwt_active_kid)
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = _make_pwd_context(settings.password_hash_rounds)
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
+    key_ring = _load_key_ring()
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)  # ..
+    user_cache = user_cache
+    token_cache = TTLCache(maxsize=settings.token_cache_size)
+    refresh_tokens = RefreshTokenStore(redis_client, ttl=settings.refresh_token_ttl)
+    revocations = RevocationList(redis_client, capacity=settings.revocation_capacity,
+                                 error_rate=settings.revocation_error_rate,
+                                 sync_interval=settings.revocation_sync_interval)
+    hash_executor = BoundedExecutor(max_workers=settings.password_hash_workers,
+                                    max_queue=settings.password_hash_queue,
+                                    retry_after=settings.password_hash_retry_after,
+                                    name="password-hash")
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
     The verify_password function takes a plain-text password and hashed
     password as arguments. It then uses the pwd_context object to verify that the
-    plain-text password matches the hashed one.
+    plain-text password matches the hashed one. The check runs on the hash_executor,
+    so it raises an HTTPException with status code 503 when the pool is saturated.
 
     :param self: Make the method a bound method, which means that it can be called on objects of this class
     :param plain_password: Pass in the password that the user enters when they log in
@@ -33,19 +87,90 @@ class Auth:
     :return: A boolean value
     :doc-author: Trelent
     """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await self.hash_executor.run(self.pwd_context.verify, plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
+    async def get_password_hash(self, password: str):
         """
     The get_password_hash function takes a password as input and returns the hash of that password.
-    The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
+    The hash is generated using the pwd_context object on the hash_executor.
 
     :param self: Represent the instance of the class
     :param password: str: Pass the password to be hashed into the function
     :return: A string that is the hash of the password
     :doc-author: Trelent
     """
-        return self.pwd_context.hash(password)
+        return await self.hash_executor.run(self.pwd_context.hash, password)
+
+    def _encode(self, claims: dict) -> str:
+        if self.key_ring is not None:
+            return self.key_ring.sign(claims)
+        return jwt.encode(claims, self.SECRET_KEY, algorithm=self.ALGORITHM)
+
+    def _decode(self, token: str) -> dict:
+        if self.key_ring is not None:
+            return self.key_ring.verify(token)
+        return jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+
+    def jwks(self) -> dict:
+        """
+    The jwks function returns the public keys that verify the tokens as a JSON Web Key Set.
+    With a symmetric algorithm there is nothing to publish and the set is empty.
+
+    :param self: Represent the instance of the class
+    :return: A dictionary with the keys
+    :doc-author: Trelent
+    """
+        if self.key_ring is None:
+            return {"keys": []}
+        return self.key_ring.jwks()
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """
+    The needs_rehash function checks whether a stored hash was made with a lower cost than the current one.
+
+    :param self: Represent the instance of the class
+    :param hashed_password: str: The stored hash of the password
+    :return: True if the password should be hashed again
+    :doc-author: Trelent
+    """
+        return self.pwd_context.needs_update(hashed_password)
+
+    async def rehash_password(self, email: str, plain_password: str, hashed_password: str) -> None:
+        """
+    The rehash_password function hashes the password again with the current cost and stores the new hash.
+    It is meant to run as a background task after a successful login, so it opens its own database session,
+    and it gives up quietly when the hashing pool is saturated: the next login will try again.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :param plain_password: str: The password the user has just logged in with
+    :param hashed_password: str: The stored hash that was verified
+    :return: None
+    :doc-author: Trelent
+    """
+        try:
+            new_hash = await self.get_password_hash(plain_password)
+        except HTTPException:
+            return
+        async with DBSession() as db:
+            await repository_users.update_password(email, hashed_password, new_hash, db)
+
+    async def calibrate_hashing(self, target_ms: float, min_rounds: int, max_rounds: int) -> int:
+        """
+    The calibrate_hashing function picks the highest bcrypt cost between min_rounds and max_rounds
+    whose hash takes no longer than target_ms on this host, and uses it for new hashes.
+
+    :param self: Represent the instance of the class
+    :param target_ms: float: The target latency of a single hash in milliseconds
+    :param min_rounds: int: The lowest cost that may be chosen
+    :param max_rounds: int: The highest cost that may be chosen
+    :return: The chosen cost
+    :doc-author: Trelent
+    """
+        rounds = await self.hash_executor.run(_calibrate_rounds, target_ms, min_rounds, max_rounds)
+        self.pwd_context = _make_pwd_context(rounds)
+        logger.info("bcrypt cost calibrated to %d rounds for a target of %s ms", rounds, target_ms)
+        return rounds
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
 
@@ -66,8 +191,8 @@ class Auth:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
             expire = datetime.utcnow() + timedelta(minutes=15)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
-        encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token", "jti": uuid.uuid4().hex})
+        encoded_access_token = self._encode(to_encode)
         return encoded_access_token
 
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -75,7 +200,7 @@ class Auth:
     The create_refresh_token function creates a refresh token for the user.
         Args:
             data (dict): A dictionary containing the user's id and username.
-            expires_delta (Optional[float]): The number of seconds until the token expires, defaults to None.
+            expires_delta (Optional[float]): The number of seconds until the token expires, defaults to REFRESH_TOKEN_TTL.
 
     :param self: Represent the instance of the class
     :param data: dict: Pass in the data that will be encoded into the token
@@ -87,12 +212,39 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=settings.refresh_token_ttl)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        encoded_refresh_token = self._encode(to_encode)
         return encoded_refresh_token
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    def decode_access_token(self, token: str) -> AccessClaims | None:
+        """
+    The decode_access_token function verifies an access token and returns its claims.
+    The claims of verified tokens are kept in token_cache, keyed by the sha256 digest of the token,
+    until the token expires, so a token sent again is not verified again.
+
+    :param self: Represent the instance of the class
+    :param token: str: The access token sent by the client
+    :return: The claims of the token, or None if the token is not a valid access token
+    :doc-author: Trelent
+    """
+        key = hashlib.sha256(token.encode()).digest()
+        claims = self.token_cache.get(key)
+        if claims is None:
+            try:
+                payload = self._decode(token)
+            except JWTError:
+                return None
+            if payload.get("scope") != "access_token" or payload.get("sub") is None:
+                return None
+            claims = AccessClaims(payload["sub"], payload["scope"], payload["exp"], payload.get("jti"),
+                                  payload.get("fam"))
+            self.token_cache.set(key, claims, ttl=claims.exp - time.time())
+        elif claims.exp <= time.time():
+            return None
+        return claims
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
     The get_current_user function is a dependency that will be used in the
         protected endpoints. It takes a token as an argument and returns the user
@@ -100,8 +252,8 @@ class Auth:
 
     :param self: Access the class attributes
     :param token: str: Get the token from the request header
-    :param db: Session: Get the database session
-    :return: The user object
+    :param db: AsyncSession: Get the database session
+    :return: The cached principal of the user
     :doc-author: Trelent
     """
         credentials_exception = HTTPException(
@@ -110,32 +262,96 @@ class Auth:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload.get("scope") == "access_token":
-                email = payload.get("sub")
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
+        claims = self.decode_access_token(token)
+        if claims is None:
+            raise credentials_exception
+        if claims.jti is not None and await self.revocations.is_revoked(claims.jti):
             raise credentials_exception
 
-        user = self.r.get(f"user:{email}")
+        user = await self.user_cache.get(claims.sub)
         if user is None:
-            user = await repository_users.get_user_by_email(email, db)
-            if user is None:
+            generation = await self.user_cache.generation(claims.sub)
+            db_user = await repository_users.get_user_by_email(claims.sub, db)
+            if db_user is None:
                 raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
-
-        if user is None:
-            raise credentials_exception
+            user = CachedUser.from_user(db_user)
+            await self.user_cache.set(user, generation)
         return user
 
+    async def issue_refresh_token(self, email: str) -> tuple[str, str]:
+        """
+    The issue_refresh_token function starts a new session of the user in the refresh token store
+    and returns its first refresh token. Every login gets its own session, so users can stay logged in
+    on several devices.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :return: The id of the session and its refresh token
+    :doc-author: Trelent
+    """
+        family, jti = await self.refresh_tokens.issue(email)
+        return family, await self.create_refresh_token(data={"sub": email, "fam": family, "jti": jti})
+
+    async def rotate_refresh_token(self, refresh_token: str) -> tuple[str, str, str]:
+        """
+    The rotate_refresh_token function exchanges a refresh token for the next one of its session.
+    Each refresh token can be used once: presenting one that was already exchanged revokes the session,
+    because it means that the token leaked. Errors raise an HTTPException with status code 401.
+
+    :param self: Represent the instance of the class
+    :param refresh_token: str: The refresh token sent by the client
+    :return: The email of the user, the id of the session and the new refresh token
+    :doc-author: Trelent
+    """
+        email = await self.decode_refresh_token(refresh_token)
+        payload = jwt.get_unverified_claims(refresh_token)
+        family, jti = payload.get("fam"), payload.get("jti")
+        if family is None or jti is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        next_jti = self.refresh_tokens.new_id()
+        rotation = await self.refresh_tokens.rotate(email, family, jti, next_jti)
+        if rotation is Rotation.REUSED:
+            logger.warning("refresh token reuse detected for %s, session %s revoked", email, family)
+        if rotation is not Rotation.ROTATED:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        return email, family, await self.create_refresh_token(data={"sub": email, "fam": family, "jti": next_jti})
+
+    async def logout(self, token: str) -> None:
+        """
+    The logout function revokes an access token before it expires and ends the session it was issued for,
+    so neither the token nor the refresh tokens of the session can be used again.
+
+    :param self: Represent the instance of the class
+    :param token: str: The access token sent by the client
+    :return: None
+    :doc-author: Trelent
+    """
+        claims = self.decode_access_token(token)
+        if claims is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+        if claims.jti is not None:
+            await self.revocations.revoke(claims.jti, claims.exp)
+        if claims.fam is not None:
+            await self.refresh_tokens.revoke(claims.sub, claims.fam)
+
+    async def logout_all(self, token: str) -> None:
+        """
+    The logout_all function revokes an access token and ends every session of its user,
+    so no refresh token of the user can be used again. Access tokens issued to the other sessions
+    stay valid until they expire.
+
+    :param self: Represent the instance of the class
+    :param token: str: The access token sent by the client
+    :return: None
+    :doc-author: Trelent
+    """
+        claims = self.decode_access_token(token)
+        if claims is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+        if claims.jti is not None:
+            await self.revocations.revoke(claims.jti, claims.exp)
+        await self.refresh_tokens.revoke_all(claims.sub)
+
     async def decode_refresh_token(self, refresh_token: str):
         """
     The decode_refresh_token function is used to decode the refresh token.
@@ -149,7 +365,7 @@ class Auth:
     :doc-author: Trelent
     """
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self._decode(refresh_token)
             if payload['scope'] == 'refresh_token':
                 email = payload['sub']
                 return email
@@ -160,8 +376,8 @@ class Auth:
     def create_email_token(self, data: dict):
         """
     The create_email_token function takes a dictionary of data and returns a token.
-    The token is encoded with the SECRET_KEY, which is stored in the .env file.
-    The algorithm used to encode the token is also stored in the .env file.
+    The token is signed with the SECRET_KEY or, for an asymmetric algorithm, with the active key of the key ring,
+    both of which are configured in the .env file.
 
     :param self: Represent the instance of the class
     :param data: dict: Pass in the user's email address
@@ -171,7 +387,7 @@ class Auth:
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=3)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "email_token"})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        token = self._encode(to_encode)
         return token
 
     def get_email_from_token(self, token: str):
@@ -186,7 +402,7 @@ class Auth:
     :doc-author: Trelent
     """
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self._decode(token)
             if payload['scope'] == 'email_token':
                 email = payload['sub']
                 return email
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import ClassVar, Optional
+
+import orjson
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.lru import TTLCache
+
+logger = logging.getLogger(__name__)
+
+redis_pool = redis.BlockingConnectionPool(
+    host=settings.redis_host,
+    port=settings.redis_port,
+    db=0,
+    max_connections=settings.redis_max_connections,
+    timeout=settings.redis_pool_timeout,
+)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# KEYS[1] - the principal, KEYS[2] - the generation of the user;
+# ARGV - the generation read before the database, the principal, ttl.
+# A reader stores what it loaded from the database only if no write started since it read the generation.
+_SET_IF_CURRENT = """
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# KEYS as above; ARGV - ttl, the committed principal (absent on evict).
+# Every write moves the generation on, so readers that loaded the user before it cannot store their copy.
+_BUMP = """
+local generation = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+if ARGV[2] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[1])
+else
+    redis.call('DEL', KEYS[1])
+end
+return generation
+"""
+
+
+@dataclass(slots=True, frozen=True)
+class CachedUser:
+    """
+The CachedUser is the principal that Auth.get_current_user keeps in Redis instead of a pickled ORM object.
+It carries only the fields the endpoints read from the current user, and no password hash or refresh token.
+It is stored as a compact orjson array that starts with SCHEMA_VERSION; entries written with another
+version are treated as a cache miss, so a deploy that changes the fields never reads a stale layout.
+
+:doc-author: Trelent
+"""
+    SCHEMA_VERSION: ClassVar[int] = 1
+
+    id: int
+    username: str | None
+    email: str
+    avatar: str | None
+    confirmed: bool
+
+    @classmethod
+    def from_user(cls, user) -> "CachedUser":
+        """
+    The from_user function builds the cached principal from a User model.
+
+    :param user: User: The user loaded from the database
+    :return: A CachedUser object
+    :doc-author: Trelent
+    """
+        return cls(id=user.id, username=user.username, email=user.email, avatar=user.avatar,
+                   confirmed=bool(user.confirmed))
+
+    def dumps(self) -> bytes:
+        """
+    The dumps function encodes the principal for Redis.
+
+    :param self: Represent the instance of the class
+    :return: The encoded principal
+    :doc-author: Trelent
+    """
+        return orjson.dumps([self.SCHEMA_VERSION, self.id, self.username, self.email, self.avatar, self.confirmed])
+
+    @classmethod
+    def loads(cls, data: bytes) -> Optional["CachedUser"]:
+        """
+    The loads function decodes a principal written by dumps.
+    Unreadable entries and entries of another schema version give None, so the caller falls back to the database.
+
+    :param data: bytes: The value read from Redis
+    :return: A CachedUser object or None
+    :doc-author: Trelent
+    """
+        try:
+            version, *fields = orjson.loads(data)
+            if version != cls.SCHEMA_VERSION:
+                return None
+            return cls(*fields)
+        except (TypeError, ValueError):
+            return None
+
+
+class UserCache:
+    """
+The UserCache keeps the cached principals in two tiers: a bounded in-process TTLCache in front of
+the shared Redis ``user:{email}`` keys, so hot users are authenticated without any I/O.
+A write to a user publishes its email on INVALIDATION_CHANNEL, and every worker listening
+on the channel drops its local copy. The local TTL bounds the staleness if a message is lost.
+Every write also moves the ``user:gen:{email}`` generation on. A request that missed the cache reads
+the generation before it loads the user from the database and stores the user only if the generation
+is unchanged, so a row read before a concurrent commit can never overwrite the committed state.
+
+:doc-author: Trelent
+"""
+    INVALIDATION_CHANNEL: ClassVar[str] = "user-cache:invalidate"
+
+    def __init__(self, client: redis.Redis, ttl: int, local_ttl: float, local_size: int):
+        self.redis = client
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=local_size, ttl=local_ttl)
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.invalidations_received = 0
+        self.fenced_writes = 0
+        self._listener: asyncio.Task | None = None
+        self._set_if_current = client.register_script(_SET_IF_CURRENT)
+        self._bump = client.register_script(_BUMP)
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"user:{email}"
+
+    @staticmethod
+    def generation_key(email: str) -> str:
+        return f"user:gen:{email}"
+
+    def _keys(self, email: str) -> list[str]:
+        return [self.key(email), self.generation_key(email)]
+
+    async def get(self, email: str) -> CachedUser | None:
+        """
+    The get function looks the principal up in the local tier first and then in Redis.
+    A principal found in Redis is copied into the local tier.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :return: A CachedUser object or None on a miss in both tiers
+    :doc-author: Trelent
+    """
+        user = self.local.get(email)
+        if user is not None:
+            return user
+        cached = await self.redis.get(self.key(email))
+        user = CachedUser.loads(cached) if cached is not None else None
+        if user is None:
+            self.redis_misses += 1
+            return None
+        self.redis_hits += 1
+        self.local.set(email, user)
+        return user
+
+    async def generation(self, email: str) -> int:
+        """
+    The generation function reads the write generation of a user, to be passed to set
+    by a request that is about to load the user from the database.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :return: The current generation
+    :doc-author: Trelent
+    """
+        return int(await self.redis.get(self.generation_key(email)) or 0)
+
+    async def set(self, user: CachedUser, generation: int) -> bool:
+        """
+    The set function stores a principal loaded from the database in both tiers,
+    unless the user was written since the generation was read.
+
+    :param self: Represent the instance of the class
+    :param user: CachedUser: The principal to store
+    :param generation: int: The generation read before the user was loaded
+    :return: True if the principal was stored
+    :doc-author: Trelent
+    """
+        stored = await self._set_if_current(keys=self._keys(user.email), args=[generation, user.dumps(), self.ttl],
+                                            client=self.redis)
+        if int(stored) != 1:
+            self.fenced_writes += 1
+            return False
+        self.local.set(user.email, user)
+        return True
+
+    async def evict(self, email: str) -> None:
+        """
+    The evict function removes the principal from Redis and from the local tier of this worker.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :return: None
+    :doc-author: Trelent
+    """
+        self.local.pop(email)
+        await self._bump(keys=self._keys(email), args=[self.ttl], client=self.redis)
+
+    async def invalidate(self, email: str) -> None:
+        """
+    The invalidate function removes the principal from Redis and from the local tier of every worker.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the changed user
+    :return: None
+    :doc-author: Trelent
+    """
+        await self.evict(email)
+        await self.redis.publish(self.INVALIDATION_CHANNEL, email)
+
+    async def write_through(self, user: CachedUser) -> None:
+        """
+    The write_through function stores the committed state of a user and drops the local copies of the other workers.
+    It runs after the database commit, so it does not raise: if Redis cannot be updated,
+    the entry is removed on a best-effort basis and the next request reads the user from the database.
+
+    :param self: Represent the instance of the class
+    :param user: CachedUser: The principal built from the committed user
+    :return: None
+    :doc-author: Trelent
+    """
+        try:
+            await self._bump(keys=self._keys(user.email), args=[self.ttl, user.dumps()], client=self.redis)
+            self.local.set(user.email, user)
+            await self.redis.publish(self.INVALIDATION_CHANNEL, user.email)
+        except RedisError as e:
+            logger.warning("user cache write-through failed for %s: %s", user.email, e)
+            self.local.pop(user.email)
+            with suppress(RedisError):
+                await self.redis.delete(self.key(user.email))
+
+    async def listen(self) -> None:
+        """
+    The listen function consumes the invalidation channel until it is cancelled.
+    The local tier is cleared whenever the subscription is (re)established, because
+    messages published while the worker was not subscribed are lost.
+
+    :param self: Represent the instance of the class
+    :return: None
+    :doc-author: Trelent
+    """
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.INVALIDATION_CHANNEL)
+                    self.local.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.local.pop(message["data"].decode())
+                            self.invalidations_received += 1
+            except RedisError as e:
+                logger.warning("user cache invalidation listener failed: %s", e)
+                self.local.clear()
+                await asyncio.sleep(1)
+
+    def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self.listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> dict:
+        return {
+            "local": self.local.stats(),
+            "redis": {"hits": self.redis_hits, "misses": self.redis_misses},
+            "invalidations_received": self.invalidations_received,
+            "fenced_writes": self.fenced_writes,
+        }
+
+
+user_cache = UserCache(redis_client, ttl=settings.user_cache_ttl, local_ttl=settings.user_cache_local_ttl,
+                       local_size=settings.user_cache_local_size)
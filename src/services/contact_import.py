@@ -0,0 +1,159 @@
+import asyncio
+import csv
+import io
+from dataclasses import dataclass, field
+from typing import AsyncIterator, BinaryIO, Iterator
+
+import orjson
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+
+from src.schemas import ContactCreateUpdate
+
+IMPORT_COLUMNS = ("line", "first_name", "second_name", "email", "phone", "birth_date")
+
+
+def read_rows(file: BinaryIO, fmt: str) -> Iterator[tuple[int, object]]:
+    """
+The read_rows function reads an uploaded CSV or NDJSON file one row at a time.
+CSV rows are dictionaries keyed by the header line, with the values past the last column of the header
+under the None key, and are numbered by the line they start on even when a quoted value spans several lines.
+NDJSON lines are decoded JSON values, or None when a line is not valid JSON. Blank lines are skipped.
+
+:param file: BinaryIO: The uploaded file
+:param fmt: str: The format of the file, csv or ndjson
+:return: An iterator of the line number and the row
+:doc-author: Trelent
+"""
+    if fmt == "csv":
+        reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+        header = next(reader, [])
+        start = reader.line_num + 1
+        for values in reader:
+            if values:
+                row = dict(zip(header, values))
+                if len(values) > len(header):
+                    row[None] = values[len(header):]
+                yield start, row
+            start = reader.line_num + 1
+        return
+    for line, raw in enumerate(file, start=1):
+        if not raw.strip():
+            continue
+        try:
+            yield line, orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            yield line, None
+
+
+@dataclass
+class ImportReport:
+    received: int = 0
+    created: int = 0
+    updated: int = 0
+    rejected: int = 0
+    errors: list[dict] = field(default_factory=list)
+    max_errors: int = 100
+
+    def reject(self, line: int, errors: list[str]) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "errors": errors})
+
+    def add_conflicts(self, lines: list[int], count: int) -> None:
+        for line in lines:
+            self.reject(line, ["Phone belongs to another contact"])
+        self.rejected += count - len(lines)
+        self.errors.sort(key=lambda error: error["line"])
+
+
+class ContactValidator:
+    """
+The ContactValidator validates the rows of an import against the ContactCreateUpdate schema and turns
+the valid ones into records for the staging table. A row whose email or phone already appeared earlier
+in the same file is rejected, so the upsert never meets the same contact twice, and so is a CSV row
+with more values than the header has columns.
+Rejected rows are counted in the report, which keeps the errors of the first max_errors of them.
+A file with more than max_rows rows is refused as a whole with an HTTPException with status code 413.
+
+:doc-author: Trelent
+"""
+
+    def __init__(self, max_errors: int = 100, max_rows: int | None = None):
+        self.report = ImportReport(max_errors=max_errors)
+        self.max_rows = max_rows
+        self._emails: set[str] = set()
+        self._phones: set[str] = set()
+
+    def validate(self, line: int, row: object) -> tuple | None:
+        """
+    The validate function validates one row of the file.
+
+    :param self: Represent the instance of the class
+    :param line: int: The line number of the row
+    :param row: object: The row as read from the file
+    :return: The record for the staging table, or None if the row is rejected
+    :doc-author: Trelent
+    """
+        if self.max_rows is not None and self.report.received >= self.max_rows:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"The file has more than {self.max_rows} rows")
+        self.report.received += 1
+        if not isinstance(row, dict):
+            self.report.reject(line, ["Invalid JSON" if row is None else "Not a JSON object"])
+            return None
+        if None in row:
+            self.report.reject(line, ["More values than columns in the header"])
+            return None
+        try:
+            contact = ContactCreateUpdate.model_validate(row)
+        except ValidationError as e:
+            self.report.reject(line, [f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()])
+            return None
+        if contact.email in self._emails or contact.phone in self._phones:
+            self.report.reject(line, ["Duplicate email or phone in the file"])
+            return None
+        self._emails.add(contact.email)
+        self._phones.add(contact.phone)
+        return line, contact.first_name, contact.second_name, contact.email, contact.phone, contact.birth_date
+
+    def validate_batch(self, rows: Iterator[tuple[int, object]], size: int) -> tuple[list[tuple], bool]:
+        """
+    The validate_batch function reads and validates up to size rows.
+
+    :param self: Represent the instance of the class
+    :param rows: Iterator[tuple[int, object]]: The rows of the file
+    :param size: int: The number of rows to read
+    :return: The valid records and whether the file is exhausted
+    :doc-author: Trelent
+    """
+        records = []
+        for count, (line, row) in enumerate(rows, start=1):
+            record = self.validate(line, row)
+            if record is not None:
+                records.append(record)
+            if count == size:
+                return records, False
+        return records, True
+
+
+async def validated_records(file: BinaryIO, fmt: str, validator: ContactValidator,
+                            batch_size: int = 1000) -> AsyncIterator[tuple]:
+    """
+The validated_records function streams the valid records of an uploaded file.
+Reading and validating are CPU bound, so every batch is handled in a worker thread
+and the event loop keeps serving other requests during a long import.
+
+:param file: BinaryIO: The uploaded file
+:param fmt: str: The format of the file, csv or ndjson
+:param validator: ContactValidator: Validates the rows and collects the rejected ones
+:param batch_size: int: The number of rows validated at a time
+:return: An async iterator of records in IMPORT_COLUMNS order
+:doc-author: Trelent
+"""
+    rows = read_rows(file, fmt)
+    exhausted = False
+    while not exhausted:
+        records, exhausted = await asyncio.to_thread(validator.validate_batch, rows, batch_size)
+        for record in records:
+            yield record
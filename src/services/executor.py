@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+
+class BoundedExecutor:
+    """
+The BoundedExecutor runs blocking CPU-bound calls, such as password hashing, on a dedicated thread pool
+so they do not freeze the event loop. bcrypt releases the GIL, so threads are enough to use several cores.
+At most max_workers calls run and max_queue more wait; a call beyond that is rejected with
+HTTP 503 and a Retry-After header instead of queueing without bound.
+
+:doc-author: Trelent
+"""
+
+    def __init__(self, max_workers: int, max_queue: int, retry_after: int, name: str):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+    The run function calls func(*args) on the pool and waits for the result.
+    The slot is held until the call finishes in its thread, even if the awaiting request is cancelled.
+
+    :param self: Represent the instance of the class
+    :param func: Callable: The blocking function to call
+    :param args: The arguments of the function
+    :return: The result of the function
+    :doc-author: Trelent
+    """
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Server is busy, try again later",
+                                    headers={"Retry-After": str(self.retry_after)})
+            self.in_flight += 1
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> dict:
+        in_flight = self.in_flight
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": min(in_flight, self.max_workers),
+            "queued": max(in_flight - self.max_workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
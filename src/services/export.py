@@ -0,0 +1,40 @@
+import csv
+import io
+from typing import AsyncIterable, AsyncIterator, Sequence
+
+import orjson
+
+
+async def ndjson_chunks(batches: AsyncIterable[Sequence], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """
+The ndjson_chunks function encodes batches of rows as newline-delimited JSON, one object per row
+and one chunk per batch.
+
+:param batches: AsyncIterable[Sequence]: The batches of rows
+:param columns: Sequence[str]: The names of the columns of a row
+:return: An async iterator of encoded chunks
+:doc-author: Trelent
+"""
+    async for batch in batches:
+        yield b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in batch)
+
+
+async def csv_chunks(batches: AsyncIterable[Sequence], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """
+The csv_chunks function encodes batches of rows as CSV with a header line.
+The header is sent before the first batch is read, so the response starts right away.
+
+:param batches: AsyncIterable[Sequence]: The batches of rows
+:param columns: Sequence[str]: The names of the columns of a row
+:return: An async iterator of encoded chunks
+:doc-author: Trelent
+"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
@@ -0,0 +1,120 @@
+from ipaddress import ip_address, ip_network, IPv4Address, IPv6Address
+from typing import Iterable
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.services.lru import TTLCache
+
+_TRUSTED_PROXY = "trusted proxy"
+
+
+class NetworkSet:
+    """
+The NetworkSet matches addresses against a list of CIDR networks.
+The networks are compiled into one set of integer prefixes per IP version and prefix length,
+so a lookup costs one set membership test per distinct prefix length instead of one comparison per network.
+
+:doc-author: Trelent
+"""
+
+    def __init__(self, networks: Iterable[str]):
+        self._prefixes: dict[tuple[int, int], set[int]] = {}
+        for value in networks:
+            network = ip_network(value, strict=False)
+            prefix = int(network.network_address) >> (network.max_prefixlen - network.prefixlen)
+            self._prefixes.setdefault((network.version, network.prefixlen), set()).add(prefix)
+        self._lengths = {version: sorted((length for v, length in self._prefixes if v == version), reverse=True)
+                         for version in (4, 6)}
+
+    def __contains__(self, address: IPv4Address | IPv6Address) -> bool:
+        value, bits = int(address), address.max_prefixlen
+        return any(value >> (bits - length) in self._prefixes[(address.version, length)]
+                   for length in self._lengths[address.version])
+
+
+def parse_address(value: str) -> IPv4Address | IPv6Address | None:
+    """
+The parse_address function parses a client address, unwrapping IPv4-mapped IPv6 addresses.
+
+:param value: str: The address as sent by the server or a proxy
+:return: The address, or None if it is not a valid IP address
+:doc-author: Trelent
+"""
+    try:
+        address = ip_address(value.strip())
+    except ValueError:
+        return None
+    if isinstance(address, IPv6Address) and address.ipv4_mapped is not None:
+        return address.ipv4_mapped
+    return address
+
+
+class IPAllowlistMiddleware:
+    """
+The IPAllowlistMiddleware is a pure ASGI middleware that answers 403 to HTTP requests from clients
+outside the allowed networks. When the peer is a trusted proxy, the client is the right-most address
+of the X-Forwarded-For header that is not a trusted proxy itself. Requests whose client address
+cannot be parsed are denied. Recent decisions are kept in an LRU keyed by the peer, and by the peer
+and the header for trusted proxies only, so clients cannot evict the cache by varying a header that is ignored.
+
+:doc-author: Trelent
+"""
+
+    def __init__(self, app: ASGIApp, allowed: Iterable[str], trusted_proxies: Iterable[str] = (),
+                 cache_size: int = 4096):
+        self.app = app
+        self.allowed = NetworkSet(allowed)
+        self.trusted_proxies = NetworkSet(trusted_proxies)
+        self.decisions = TTLCache(maxsize=cache_size)
+
+    def client_address(self, peer: str, forwarded_for: str | None) -> IPv4Address | IPv6Address | None:
+        """
+    The client_address function finds the address of the client behind the trusted proxies.
+
+    :param self: Represent the instance of the class
+    :param peer: str: The address of the peer of the connection
+    :param forwarded_for: str | None: The X-Forwarded-For header
+    :return: The address of the client, or None if it is not a valid IP address
+    :doc-author: Trelent
+    """
+        address = parse_address(peer)
+        if address is None or forwarded_for is None or address not in self.trusted_proxies:
+            return address
+        for hop in reversed(forwarded_for.split(",")):
+            address = parse_address(hop)
+            if address is None or address not in self.trusted_proxies:
+                return address
+        return address
+
+    def is_allowed(self, peer: str, forwarded_for: str | None) -> bool:
+        allowed = self.decisions.get(peer)
+        if allowed is None:
+            address = parse_address(peer)
+            if address is not None and address in self.trusted_proxies:
+                allowed = _TRUSTED_PROXY
+            else:
+                allowed = address is not None and address in self.allowed
+            self.decisions.set(peer, allowed)
+        if allowed is not _TRUSTED_PROXY:
+            return allowed
+        key = (peer, forwarded_for)
+        allowed = self.decisions.get(key)
+        if allowed is None:
+            address = self.client_address(peer, forwarded_for)
+            allowed = address is not None and address in self.allowed
+            self.decisions.set(key, allowed)
+        return allowed
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        peer = scope["client"][0] if scope.get("client") else ""
+        forwarded_for = ",".join(Headers(scope=scope).getlist("x-forwarded-for")) or None
+        if self.is_allowed(peer, forwarded_for):
+            await self.app(scope, receive, send)
+            return
+        response = JSONResponse(status_code=403, content={"detail": "Not allowed IP address"})
+        await response(scope, receive, send)
@@ -0,0 +1,86 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    private: Key
+    public: Key
+    public_jwk: dict
+
+
+class KeyRing:
+    """
+The KeyRing holds the asymmetric (RS256/ES256) keys that sign and verify the tokens.
+Every key is parsed once into a jose Key object, so signing and verification do not parse PEM again.
+The active key signs new tokens with its kid in the header; every key of the ring verifies,
+so a rotated-out key keeps accepting the tokens it signed until it is removed from the ring.
+
+:doc-author: Trelent
+"""
+
+    def __init__(self, algorithm: str, private_keys: dict[str, str], active_kid: str):
+        if active_kid not in private_keys:
+            raise ValueError(f"Active key {active_kid!r} is not in the key ring")
+        self.algorithm = algorithm
+        self.active_kid = active_kid
+        self._keys: dict[str, SigningKey] = {}
+        for kid, pem in private_keys.items():
+            private = jwk.construct(pem, algorithm)
+            public = private.public_key()
+            self._keys[kid] = SigningKey(kid=kid, private=private, public=public,
+                                         public_jwk={**public.to_dict(), "kid": kid, "use": "sig"})
+        self._jwks = {"keys": [key.public_jwk for key in self._keys.values()]}
+
+    @classmethod
+    def from_directory(cls, path: str, algorithm: str, active_kid: str = "") -> "KeyRing":
+        """
+    The from_directory function loads every <kid>.pem private key of a directory.
+    Without an explicit active_kid the last kid in sort order signs, so a new key can be rolled out
+    by adding a file whose name sorts after the current one.
+
+    :param path: str: The directory with the PEM files
+    :param algorithm: str: The signing algorithm, e.g. RS256
+    :param active_kid: str: The kid of the signing key
+    :return: A KeyRing object
+    :doc-author: Trelent
+    """
+        files = sorted(Path(path).glob("*.pem"))
+        if not files:
+            raise ValueError(f"No signing keys found in {path}")
+        private_keys = {file.stem: file.read_text() for file in files}
+        return cls(algorithm, private_keys, active_kid or files[-1].stem)
+
+    def sign(self, claims: dict) -> str:
+        """
+    The sign function encodes the claims with the active key.
+
+    :param self: Represent the instance of the class
+    :param claims: dict: The claims of the token
+    :return: The encoded token
+    :doc-author: Trelent
+    """
+        key = self._keys[self.active_kid]
+        return jwt.encode(claims, key.private, algorithm=self.algorithm, headers={"kid": key.kid})
+
+    def verify(self, token: str) -> dict:
+        """
+    The verify function decodes a token with the key named by its kid header.
+    A token without a kid, or with the kid of an unknown key, raises JWTError.
+
+    :param self: Represent the instance of the class
+    :param token: str: The encoded token
+    :return: The claims of the token
+    :doc-author: Trelent
+    """
+        key = self._keys.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, key.public, algorithms=[self.algorithm])
+
+    def jwks(self) -> dict:
+        return self._jwks
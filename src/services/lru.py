@@ -0,0 +1,80 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """
+The TTLCache is a bounded in-process LRU map whose entries also expire after a time to live.
+When it is full the least recently used entry is dropped, so its memory never grows past maxsize entries.
+It counts its hits and misses, and it is not thread-safe: use it from the event loop only.
+
+:doc-author: Trelent
+"""
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+    The get function returns the value stored under key and marks it as recently used.
+    Missing and expired entries count as a miss and give the default.
+
+    :param self: Represent the instance of the class
+    :param key: Hashable: The key to look up
+    :param default: Any: The value returned on a miss
+    :return: The cached value or the default
+    :doc-author: Trelent
+    """
+        item = self._data.get(key)
+        if item is not None:
+            value, expires_at = item
+            if expires_at is None or expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """
+    The set function stores a value, evicting the least recently used entry when the cache is full.
+
+    :param self: Represent the instance of the class
+    :param key: Hashable: The key of the entry
+    :param value: Any: The value to store
+    :param ttl: float | None: The time to live in seconds, defaults to the ttl of the cache
+    :return: None
+    :doc-author: Trelent
+    """
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any:
+        """
+    The pop function removes an entry and returns its value, or None if there was no such entry.
+
+    :param self: Represent the instance of the class
+    :param key: Hashable: The key of the entry
+    :return: The removed value
+    :doc-author: Trelent
+    """
+        item = self._data.pop(key, None)
+        return item[0] if item is not None else None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
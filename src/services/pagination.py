@@ -0,0 +1,36 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+The encode_cursor function turns the id of the last row of a page into an opaque cursor for the next page.
+
+:param last_id: int: The id of the last item on the current page
+:return: A url-safe cursor string
+:doc-author: Trelent
+"""
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+The decode_cursor function restores the id encoded by encode_cursor.
+A malformed cursor raises an HTTPException with status code 400.
+
+:param cursor: str: The cursor sent by the client
+:return: The id after which the next page starts
+:doc-author: Trelent
+"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_id = json.loads(raw)["id"]
+        if not isinstance(last_id, int):
+            raise TypeError(last_id)
+        return last_id
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
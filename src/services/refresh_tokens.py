@@ -0,0 +1,142 @@
+import uuid
+from enum import Enum
+
+import redis.asyncio as redis
+
+# KEYS[1] - the family hash, KEYS[2] - the set of families of the user; ARGV - presented jti, next jti, ttl, family.
+# The presented jti must be the current one; an older jti of the family means the token was stolen
+# and replayed, so the whole family is revoked. A family that is gone is dropped from the user's set as well.
+_ROTATE = """
+local current = redis.call('HGET', KEYS[1], 'jti')
+if not current then
+    redis.call('SREM', KEYS[2], ARGV[4])
+    return 0
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[4])
+    return -1
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+
+class Rotation(Enum):
+    ROTATED = 1
+    UNKNOWN = 0
+    REUSED = -1
+
+
+class RefreshTokenStore:
+    """
+The RefreshTokenStore keeps the refresh tokens in Redis instead of the users table.
+Each login starts a token family, one per device, stored as ``refresh:{family}`` with the email and the jti
+of the only refresh token of the family that is currently valid. Refreshing rotates the jti atomically;
+presenting a jti that was already rotated is a reuse and revokes the family.
+Families expire together with their last token. The families of a user are listed in ``refresh:user:{email}``,
+which lives as long as the most recently used family, so all sessions of the user can be revoked at once.
+
+:doc-author: Trelent
+"""
+
+    def __init__(self, client: redis.Redis, ttl: int):
+        self.redis = client
+        self.ttl = ttl
+        self._rotate = client.register_script(_ROTATE)
+
+    @staticmethod
+    def family_key(family: str) -> str:
+        return f"refresh:{family}"
+
+    @staticmethod
+    def user_key(email: str) -> str:
+        return f"refresh:user:{email}"
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    async def issue(self, email: str) -> tuple[str, str]:
+        """
+    The issue function starts a new token family for a login.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :return: The family id and the jti of its first refresh token
+    :doc-author: Trelent
+    """
+        family, jti = self.new_id(), self.new_id()
+        expired = await self._expired_families(email)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if expired:
+                pipe.srem(self.user_key(email), *expired)
+            pipe.hset(self.family_key(family), mapping={"sub": email, "jti": jti})
+            pipe.expire(self.family_key(family), self.ttl)
+            pipe.sadd(self.user_key(email), family)
+            pipe.expire(self.user_key(email), self.ttl)
+            await pipe.execute()
+        return family, jti
+
+    async def _expired_families(self, email: str) -> list[str]:
+        """
+    The _expired_families function finds the families in the set of a user whose hash expired,
+    so the set does not keep growing while the user has at least one active session.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :return: The ids of the expired families
+    :doc-author: Trelent
+    """
+        families = [family.decode() for family in await self.redis.smembers(self.user_key(email))]
+        if not families:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for family in families:
+                pipe.exists(self.family_key(family))
+            alive = await pipe.execute()
+        return [family for family, exists in zip(families, alive) if not exists]
+
+    async def rotate(self, email: str, family: str, jti: str, next_jti: str) -> Rotation:
+        """
+    The rotate function replaces the current jti of a family with next_jti.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :param family: str: The family id of the presented token
+    :param jti: str: The jti of the presented token
+    :param next_jti: str: The jti of the token that replaces it
+    :return: ROTATED, UNKNOWN if the family expired or was revoked, or REUSED if the token was already rotated
+    :doc-author: Trelent
+    """
+        return Rotation(int(await self._rotate(keys=[self.family_key(family), self.user_key(email)],
+                                               args=[jti, next_jti, self.ttl, family])))
+
+    async def revoke(self, email: str, family: str) -> None:
+        """
+    The revoke function ends a single session, e.g. on logout.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :param family: str: The family id of the session
+    :return: None
+    :doc-author: Trelent
+    """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self.family_key(family))
+            pipe.srem(self.user_key(email), family)
+            await pipe.execute()
+
+    async def revoke_all(self, email: str) -> None:
+        """
+    The revoke_all function ends every session of a user, e.g. on logout from all devices.
+
+    :param self: Represent the instance of the class
+    :param email: str: The email of the user
+    :return: None
+    :doc-author: Trelent
+    """
+        families = await self.redis.smembers(self.user_key(email))
+        await self.redis.delete(self.user_key(email), *(self.family_key(family.decode()) for family in families))
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import ClassVar
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# KEYS - the revoked:{jti} flag, the index, the log and its sequence; ARGV - jti, exp, ttl.
+# The sequence is taken on the server, so every worker sees the log in the order the revocations were made.
+_REVOKE = """
+redis.call('SET', KEYS[1], 1, 'EX', ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+redis.call('ZADD', KEYS[3], redis.call('INCR', KEYS[4]), ARGV[1])
+"""
+
+# KEYS - the index and the log; ARGV - now.
+# Drops the expired revocations from both and returns the rest of the log with the sequence of each entry.
+_PRUNE = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, jti in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], jti)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+return redis.call('ZRANGE', KEYS[2], 0, -1, 'WITHSCORES')
+"""
+
+
+class BloomFilter:
+    """
+The BloomFilter is a fixed-size set of strings that may answer a false positive but never a false negative.
+It is sized for capacity items at the given error_rate.
+
+:doc-author: Trelent
+"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """
+The RevocationList revokes access tokens by their jti before they expire.
+A revoked jti is stored in Redis as ``revoked:{jti}`` for the remaining life of the token, indexed
+in the ``revoked:index`` sorted set by its expiry and appended to the ``revoked:log`` sorted set under
+a sequence number. Every sync_interval seconds each worker adds the log entries after the last sequence
+it has seen to a local BloomFilter, and only a jti that the filter may contain is looked up in Redis,
+so checking a token that was not revoked costs no I/O. A revocation made by another worker takes effect
+here after the next sync at the latest. Every rebuild_every syncs, or once the filter is full,
+the expired revocations are dropped and the filter is rebuilt from the rest of the log.
+
+:doc-author: Trelent
+"""
+    INDEX_KEY: ClassVar[str] = "revoked:index"
+    LOG_KEY: ClassVar[str] = "revoked:log"
+    SEQUENCE_KEY: ClassVar[str] = "revoked:sequence"
+
+    def __init__(self, client: redis.Redis, capacity: int, error_rate: float, sync_interval: float,
+                 rebuild_every: int = 60):
+        self.redis = client
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_every = rebuild_every
+        self.bloom = BloomFilter(capacity, error_rate)
+        self._cursor: float | None = None
+        self._syncs = 0
+        self._revoked_during_rebuild: list[str] | None = None
+        self._revoke = client.register_script(_REVOKE)
+        self._prune = client.register_script(_PRUNE)
+        self.skipped = 0
+        self.lookups = 0
+        self.revoked_hits = 0
+        self._syncer: asyncio.Task | None = None
+
+    @staticmethod
+    def key(jti: str) -> str:
+        return f"revoked:{jti}"
+
+    async def revoke(self, jti: str, expires_at: float) -> None:
+        """
+    The revoke function revokes a token until it expires.
+
+    :param self: Represent the instance of the class
+    :param jti: str: The jti of the token
+    :param expires_at: float: The exp claim of the token
+    :return: None
+    :doc-author: Trelent
+    """
+        ttl = math.ceil(expires_at - time.time())
+        if ttl <= 0:
+            return
+        await self._revoke(keys=[self.key(jti), self.INDEX_KEY, self.LOG_KEY, self.SEQUENCE_KEY],
+                           args=[jti, expires_at, ttl], client=self.redis)
+        self.bloom.add(jti)
+        if self._revoked_during_rebuild is not None:
+            self._revoked_during_rebuild.append(jti)
+
+    async def is_revoked(self, jti: str) -> bool:
+        """
+    The is_revoked function checks whether a token was revoked.
+
+    :param self: Represent the instance of the class
+    :param jti: str: The jti of the token
+    :return: True if the token was revoked
+    :doc-author: Trelent
+    """
+        if jti not in self.bloom:
+            self.skipped += 1
+            return False
+        self.lookups += 1
+        revoked = bool(await self.redis.exists(self.key(jti)))
+        self.revoked_hits += revoked
+        return revoked
+
+    async def sync(self) -> None:
+        """
+    The sync function adds the revocations logged since the last sync to the local filter,
+    or rebuilds the filter when it is due.
+
+    :param self: Represent the instance of the class
+    :return: None
+    :doc-author: Trelent
+    """
+        if self._cursor is None or self._syncs >= self.rebuild_every or self.bloom.count >= self.capacity:
+            await self.rebuild()
+            return
+        entries = await self.redis.zrangebyscore(self.LOG_KEY, f"({self._cursor}", "+inf", withscores=True)
+        for jti, sequence in entries:
+            jti = jti.decode()
+            if jti not in self.bloom:
+                self.bloom.add(jti)
+            self._cursor = max(self._cursor, sequence)
+        self._syncs += 1
+
+    async def rebuild(self) -> None:
+        """
+    The rebuild function drops the expired revocations from Redis and replaces the local filter
+    with one built from the rest of the log. Tokens revoked by this worker while the log is read
+    are added to the new filter too.
+
+    :param self: Represent the instance of the class
+    :return: None
+    :doc-author: Trelent
+    """
+        self._revoked_during_rebuild = revoked = []
+        try:
+            entries = await self._prune(keys=[self.INDEX_KEY, self.LOG_KEY], args=[time.time()], client=self.redis)
+        finally:
+            self._revoked_during_rebuild = None
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        cursor = self._cursor or 0
+        for jti, sequence in zip(entries[::2], entries[1::2]):
+            bloom.add(jti.decode())
+            cursor = max(cursor, float(sequence))
+        for jti in revoked:
+            if jti not in bloom:
+                bloom.add(jti)
+        self.bloom = bloom
+        self._cursor = cursor
+        self._syncs = 0
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except RedisError as e:
+                logger.warning("revocation list sync failed: %s", e)
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self) -> None:
+        if self._syncer is None:
+            self._syncer = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._syncer is not None:
+            self._syncer.cancel()
+            try:
+                await self._syncer
+            except asyncio.CancelledError:
+                pass
+            self._syncer = None
+
+    def stats(self) -> dict:
+        return {"entries": self.bloom.count, "skipped": self.skipped, "lookups": self.lookups,
+                "revoked_hits": self.revoked_hits}
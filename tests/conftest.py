@@ -1,7 +1,11 @@
+import asyncio
+import os
+
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
 from fastapi import FastAPI
 #from main import app
 from src.database.models import ContactModel, User, Base
@@ -10,38 +14,88 @@ from unittest.mock import AsyncMock
 #from src.routes import contacts, auth, users
 
 app = FastAPI()
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=NullPool
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, bind=engine)
+
+# A disposable PostgreSQL database for the tests of queries that SQLite cannot run; its tables are dropped and recreated.
+TEST_POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+async def init_models():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
 
 
 @pytest.fixture(scope="module")
 def session():
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    asyncio.run(init_models())
 
     db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    yield db
 
 
 @pytest.fixture(scope="module")
 def client(session):
-    def override_get_db():
+    async def override_get_db():
         try:
             yield session
         finally:
-            session.close()
+            await session.close()
 
     app.dependency_overrides[get_db] = override_get_db
     yield TestClient(app)
 
 
+@pytest_asyncio.fixture
+async def sqlite_session():
+    sqlite_engine = create_async_engine("sqlite+aiosqlite://")
+    try:
+        async with sqlite_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(sqlite_engine, expire_on_commit=False) as db:
+            yield db
+    finally:
+        await sqlite_engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def sqlite_users(sqlite_session):
+    owner = User(id=1, email="owner@example.com", password="x")
+    other = User(id=2, email="other@example.com", password="x")
+    sqlite_session.add_all([owner, other])
+    await sqlite_session.commit()
+    return owner, other
+
+
+@pytest_asyncio.fixture
+async def pg_session():
+    if TEST_POSTGRES_URL is None:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    pg_engine = create_async_engine(TEST_POSTGRES_URL)
+    try:
+        async with pg_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(pg_engine, expire_on_commit=False) as db:
+            yield db
+    finally:
+        await pg_engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def pg_users(pg_session):
+    owner = User(id=1, email="owner@example.com", password="x")
+    other = User(id=2, email="other@example.com", password="x")
+    pg_session.add_all([owner, other])
+    await pg_session.commit()
+    return owner, other
+
+
 @pytest.fixture()
 def mock_ratelimiter(monkeypatch):
     mock_rate_limiter = AsyncMock()()
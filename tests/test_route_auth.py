@@ -25,7 +25,6 @@ def mock_user_repository(monkeypatch):
     mock = AsyncMock()
     monkeypatch.setattr('src.repository.users.get_user_by_email', mock.get_user_by_email)
     monkeypatch.setattr('src.repository.users.create_user', mock.create_user)
-    monkeypatch.setattr('src.repository.users.update_token', mock.update_token)
     monkeypatch.setattr('src.repository.users.confirmed_email', mock.confirmed_email)
     return mock
 
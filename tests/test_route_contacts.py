@@ -0,0 +1,102 @@
+import asyncio
+import json
+import logging
+from datetime import date
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from starlette.formparsers import MultiPartParser
+
+from src.conf.config import settings
+from src.database.db import get_db
+from src.database.instrumentation import instrument
+from src.database.models import Base, User, ContactModel
+from src.routes import contacts
+from src.services.auth import auth_service
+
+app = FastAPI()
+app.include_router(contacts.router, prefix="/api")
+
+OWNER = User(id=1, email="owner@example.com", password="x")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'contacts.db'}", poolclass=NullPool)
+    instrument(engine.sync_engine)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    async def init_models():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with session_maker() as db:
+            db.add(User(id=OWNER.id, email=OWNER.email, password=OWNER.password))
+            db.add(ContactModel(first_name="Ann", second_name="Doe", email="ann@example.com", phone="1",
+                                birth_date=date(1990, 1, 1), user_id=OWNER.id))
+            await db.commit()
+
+    asyncio.run(init_models())
+    monkeypatch.setattr(contacts, "DBSession", session_maker)
+
+    async def override_get_db():
+        async with session_maker() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[auth_service.get_current_user] = lambda: OWNER
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_export_queries_are_logged_with_the_route(client, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "db_slow_query_ms", 60_000)
+    monkeypatch.setattr(settings, "db_query_sample_rate", 1)
+    with caplog.at_level(logging.INFO, logger="src.database.queries"):
+        response = client.get("/api/contacts/export")
+    assert response.status_code == 200
+    assert json.loads(response.text)["email"] == "ann@example.com"
+    routes = {json.loads(record.getMessage())["route"] for record in caplog.records}
+    assert routes == {"GET /api/contacts/export"}
+
+
+def test_import_over_the_size_limit_is_refused(client, monkeypatch):
+    monkeypatch.setattr(settings, "import_max_bytes", 1024)
+    imported = []
+
+    # The bulk upsert of the import only runs on PostgreSQL
+    async def import_contacts(records, user, db):
+        imported.extend([record async for record in records])
+        return {"created": len(imported), "updated": 0, "conflicts": 0, "conflict_lines": []}
+
+    monkeypatch.setattr(contacts.repository_contacts, "import_contacts", import_contacts)
+    parsed = []
+    parse = MultiPartParser.parse
+
+    async def spy_parse(self):
+        parsed.append(self)
+        return await parse(self)
+
+    monkeypatch.setattr(MultiPartParser, "parse", spy_parse)
+    line = b'{"first_name": "Bob", "second_name": "Doe", "email": "bob@example.com", "phone": "2", ' \
+           b'"birth_date": "1990-01-01"}\n'
+    response = client.post("/api/contacts/import", files={"file": ("contacts.ndjson", line * 20)})
+    assert response.status_code == 413
+    # The Content-Length is over the limit, so the form is not even parsed
+    assert parsed == [] and imported == []
+
+    response = client.post("/api/contacts/import", files={"file": ("contacts.ndjson", line)})
+    assert response.status_code == 200
+    assert response.json()["created"] == 1
+
+
+def test_chunked_import_over_the_size_limit_is_refused(client, monkeypatch):
+    monkeypatch.setattr(settings, "import_max_bytes", 1024)
+    body = b"--boundary\r\nContent-Disposition: form-data; name=\"file\"; filename=\"contacts.ndjson\"\r\n\r\n" \
+           + b"{}\n" * 1024 + b"\r\n--boundary--\r\n"
+    # Without a Content-Length, the body is refused once the received bytes go over the limit
+    response = client.post("/api/contacts/import", content=iter([body[:512], body[512:]]),
+                           headers={"Content-Type": "multipart/form-data; boundary=boundary"})
+    assert response.status_code == 413
@@ -0,0 +1,89 @@
+import unittest
+from datetime import date
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+
+from src.database.models import ContactModel
+from src.repository.contacts import apply_batch, upsert
+from src.schemas import ContactBatch, ContactCreateUpdate
+
+
+def contact(n: int) -> dict:
+    return {"first_name": f"First{n}", "second_name": f"Second{n}", "email": f"c{n}@example.com", "phone": f"{n}",
+            "birth_date": "1990-01-02"}
+
+
+class TestContactBatch(unittest.TestCase):
+    def test_operations_need_their_fields(self):
+        for operation in ({"op": "create"}, {"op": "update", "id": 1}, {"op": "update", "contact": contact(1)},
+                          {"op": "delete"}):
+            with self.assertRaises(ValidationError):
+                ContactBatch(operations=[operation])
+
+    def test_contact_appears_once(self):
+        with self.assertRaises(ValidationError):
+            ContactBatch(operations=[{"op": "delete", "id": 1}, {"op": "update", "id": 1, "contact": contact(1)}])
+        with self.assertRaises(ValidationError):
+            ContactBatch(operations=[{"op": "create", "contact": contact(1)}, {"op": "create", "contact": contact(1)}])
+        with self.assertRaises(ValidationError):
+            ContactBatch(operations=[])
+
+    def test_phone_appears_once(self):
+        with self.assertRaises(ValidationError) as err:
+            ContactBatch(operations=[{"op": "create", "contact": contact(1)}, {"op": "create", "contact": contact(2)},
+                                     {"op": "create", "contact": {**contact(3), "phone": "1"}}])
+        self.assertIn("Operation 2", str(err.exception))
+        with self.assertRaises(ValidationError):
+            ContactBatch(operations=[{"op": "update", "id": 1, "contact": contact(1)},
+                                     {"op": "create", "contact": {**contact(2), "phone": "1"}}])
+
+
+async def run_batches(db, owner, *batches):
+    results = []
+    for batch in batches:
+        try:
+            results.append(await apply_batch(ContactBatch(operations=batch).operations, owner, db))
+        except IntegrityError:
+            await db.rollback()
+            await db.refresh(owner)
+            results.append(None)
+    rows = await db.execute(select(ContactModel.id, ContactModel.email).order_by(ContactModel.id))
+    return results, [tuple(row) for row in rows]
+
+
+@pytest.mark.asyncio
+async def test_applies_operations_in_one_transaction(pg_session, pg_users):
+    owner, other = pg_users
+    pg_session.add(ContactModel(id=100, first_name="Not", second_name="Mine", email="theirs@example.com", phone="100",
+                                birth_date=date(1990, 1, 1), user=other))
+    await pg_session.commit()
+    results, rows = await run_batches(
+        pg_session, owner,
+        [{"op": "create", "contact": contact(1)}, {"op": "create", "contact": contact(2)}],
+        [{"op": "update", "id": 2, "contact": contact(22)}, {"op": "delete", "id": 1},
+         {"op": "create", "contact": contact(1)}, {"op": "delete", "id": 100},
+         {"op": "update", "id": 999, "contact": contact(9)}],
+        [{"op": "create", "contact": contact(3)}, {"op": "create", "contact": {**contact(4), "phone": "22"}}],
+        [{"op": "create", "contact": {**contact(22), "first_name": "Again"}},
+         {"op": "create", "contact": {**contact(5), "email": "theirs@example.com"}}],
+    )
+    assert [(result["id"], result["status"]) for result in results[0]] == [(1, "created"), (2, "created")]
+    assert [(result["index"], result["id"], result["status"]) for result in results[1]] == [
+        (0, 2, "updated"), (1, 1, "deleted"), (2, 3, "created"), (3, 100, "not_found"), (4, 999, "not_found")]
+    assert results[2] is None
+    assert [(result["id"], result["status"]) for result in results[3]][0] == (2, "updated")
+    assert results[3][1]["status"] == "created"
+    assert rows == [(2, "c22@example.com"), (3, "c1@example.com"), (results[3][1]["id"], "theirs@example.com"),
+                    (100, "theirs@example.com")]
+
+
+@pytest.mark.asyncio
+async def test_upsert_is_idempotent(pg_session, pg_users):
+    owner, _ = pg_users
+    first = await upsert(ContactCreateUpdate(**contact(1)), owner, pg_session)
+    second = await upsert(ContactCreateUpdate(**{**contact(1), "first_name": "Renamed"}), owner, pg_session)
+    count = await pg_session.scalar(select(func.count()).select_from(ContactModel))
+    assert (first.id, second.id, second.first_name, count) == (1, 1, "Renamed", 1)
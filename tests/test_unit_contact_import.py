@@ -0,0 +1,97 @@
+import asyncio
+import io
+import unittest
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from src.database.models import ContactModel
+from src.repository.contacts import import_contacts
+from src.services.contact_import import ContactValidator, read_rows, validated_records
+
+CSV = (b"first_name,second_name,email,phone,birth_date\n"
+       b"John,Doe,john@example.com,100,1990-01-02\n"
+       b"Bad,Email,not-an-email,101,1990-01-02\n"
+       b"Jane,Doe,jane@example.com,100,1990-01-02\n"
+       b"Bad,Date,bad@example.com,102,1990-13-02\n")
+
+
+def collect(file: io.BytesIO, fmt: str, validator: ContactValidator, batch_size: int = 2) -> list[tuple]:
+    async def run():
+        return [record async for record in validated_records(file, fmt, validator, batch_size=batch_size)]
+    return asyncio.run(run())
+
+
+class TestContactValidator(unittest.TestCase):
+    def test_csv_rows_are_validated_with_their_line_numbers(self):
+        validator = ContactValidator()
+        records = collect(io.BytesIO(CSV), "csv", validator)
+        self.assertEqual(records, [(2, "John", "Doe", "john@example.com", "100", date(1990, 1, 2))])
+        report = validator.report
+        self.assertEqual((report.received, report.rejected), (4, 3))
+        self.assertEqual([error["line"] for error in report.errors], [3, 4, 5])
+        self.assertTrue(report.errors[0]["errors"][0].startswith("email:"))
+        self.assertEqual(report.errors[1]["errors"], ["Duplicate email or phone in the file"])
+        self.assertTrue(report.errors[2]["errors"][0].startswith("birth_date:"))
+
+    def test_ndjson_skips_blank_lines_and_rejects_non_objects(self):
+        data = (b'{"first_name": "John", "second_name": "Doe", "email": "john@example.com", "phone": "100",'
+                b' "birth_date": "1990-01-02"}\n\nnot json\n[1, 2]\n')
+        self.assertEqual([line for line, _ in read_rows(io.BytesIO(data), "ndjson")], [1, 3, 4])
+        validator = ContactValidator()
+        records = collect(io.BytesIO(data), "ndjson", validator)
+        self.assertEqual([record[0] for record in records], [1])
+        self.assertEqual(validator.report.errors, [{"line": 3, "errors": ["Invalid JSON"]},
+                                                   {"line": 4, "errors": ["Not a JSON object"]}])
+
+    def test_csv_rows_are_numbered_by_their_first_line(self):
+        data = (b"first_name,second_name,email,phone,birth_date\n"
+                b"\"John\nJr.\",Doe,john@example.com,100,1990-01-02\n"
+                b"\n"
+                b"Jane,Doe,jane@example.com,101,1990-01-02,extra\n")
+        rows = list(read_rows(io.BytesIO(data), "csv"))
+        self.assertEqual([line for line, _ in rows], [2, 5])
+        self.assertEqual(rows[0][1]["first_name"], "John\nJr.")
+        validator = ContactValidator()
+        collect(io.BytesIO(data), "csv", validator)
+        self.assertEqual(validator.report.errors, [{"line": 5, "errors": ["More values than columns in the header"]}])
+
+    def test_files_with_too_many_rows_are_refused(self):
+        collect(io.BytesIO(CSV), "csv", ContactValidator(max_rows=4))
+        with self.assertRaises(HTTPException) as err:
+            collect(io.BytesIO(CSV), "csv", ContactValidator(max_rows=3))
+        self.assertEqual(err.exception.status_code, 413)
+
+    def test_report_keeps_first_errors_but_counts_all(self):
+        validator = ContactValidator(max_errors=1)
+        collect(io.BytesIO(CSV), "csv", validator)
+        validator.report.add_conflicts([2], 3)
+        self.assertEqual(validator.report.rejected, 6)
+        self.assertEqual([error["line"] for error in validator.report.errors], [3])
+
+
+@pytest.mark.asyncio
+async def test_import_upserts_by_email_and_reports_taken_phones(pg_session, pg_users):
+    owner, other = pg_users
+    pg_session.add_all([ContactModel(first_name="Old", second_name="Name", email="mine@example.com", phone="1",
+                                     birth_date=date(1990, 1, 1), user=owner),
+                        ContactModel(first_name="Not", second_name="Mine", email="theirs@example.com", phone="2",
+                                     birth_date=date(1990, 1, 1), user=other)])
+    await pg_session.commit()
+
+    async def records():
+        yield 2, "New", "Name", "mine@example.com", "1", date(1991, 2, 3)
+        yield 3, "Fresh", "Contact", "fresh@example.com", "3", date(1992, 3, 4)
+        yield 4, "Shared", "Email", "theirs@example.com", "4", date(1990, 1, 1)
+        yield 5, "Shared", "Phone", "phone@example.com", "2", date(1990, 1, 1)
+        yield 6, "Taken", "Phone", "taken@example.com", "1", date(1990, 1, 1)
+
+    result = await import_contacts(records(), owner, pg_session)
+    contacts = await pg_session.execute(select(ContactModel.email, ContactModel.first_name, ContactModel.user_id)
+                                        .order_by(ContactModel.user_id, ContactModel.email))
+    assert result == {"created": 3, "updated": 1, "conflicts": 1, "conflict_lines": [6]}
+    assert [tuple(row) for row in contacts] == [("fresh@example.com", "Fresh", 1), ("mine@example.com", "New", 1),
+                                                ("phone@example.com", "Shared", 1),
+                                                ("theirs@example.com", "Shared", 1), ("theirs@example.com", "Not", 2)]
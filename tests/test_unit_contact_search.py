@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+import pytest_asyncio
+
+from src.database.models import ContactModel
+from src.repository.contacts import search_contacts
+
+
+@pytest_asyncio.fixture
+async def search(pg_session, pg_users):
+    owner, other = pg_users
+    pg_session.add_all([
+        ContactModel(id=n, first_name=first_name, second_name=second_name, email=f"c{n}@example.com",
+                     phone=f"{100 + n}", birth_date=date(1990, 1, 1), user=user)
+        for n, first_name, second_name, user in (
+            (1, "Catherine", "Jones", owner),
+            (2, "Ann", "Katherinesson", owner),
+            (3, "Katherine", "Smith", owner),
+            (4, "Catherine", "Smith", owner),
+            (5, "Kathryn", "Smith", owner),
+            (6, "Katherine", "Smith", other),
+        )
+    ])
+    await pg_session.commit()
+
+    async def run(query: str, limit: int = 10, offset: int = 0) -> list[int]:
+        return [contact.id for contact in await search_contacts(query, limit, offset, owner, pg_session)]
+
+    return run
+
+
+@pytest.mark.asyncio
+async def test_prefix_matches_come_before_similar_ones(search):
+    # Katherine and Katherinesson start with the query, both Catherines are similar with the same score
+    # and are ordered by id, Kathryn is below the similarity threshold, contact 6 belongs to another user
+    assert await search("katherine") == [3, 2, 1, 4]
+
+
+@pytest.mark.asyncio
+async def test_like_wildcards_in_the_query_are_literal(search):
+    # Unescaped, "%" would match every contact and "_a" every one with an "a" as the second letter of a name
+    assert await search("%") == []
+    assert await search("_a") == []
+
+
+@pytest.mark.asyncio
+async def test_search_is_paged(search):
+    assert await search("katherine", limit=2) == [3, 2]
+    assert await search("katherine", limit=2, offset=2) == [1, 4]
+    assert await search("katherine", limit=2, offset=4) == []
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from src.services.executor import BoundedExecutor
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_saturated():
+    executor = BoundedExecutor(max_workers=1, max_queue=1, retry_after=3, name="test")
+    gate = threading.Event()
+    try:
+        running = asyncio.ensure_future(executor.run(gate.wait))
+        queued = asyncio.ensure_future(executor.run(gate.wait))
+        await asyncio.sleep(0.05)
+        assert executor.metrics()["running"] == 1
+        assert executor.metrics()["queued"] == 1
+
+        with pytest.raises(HTTPException) as err:
+            await executor.run(gate.wait)
+        assert err.value.status_code == 503
+        assert err.value.headers == {"Retry-After": "3"}
+
+        gate.set()
+        assert await asyncio.gather(running, queued) == [True, True]
+        metrics = executor.metrics()
+        assert (metrics["running"], metrics["queued"], metrics["completed"], metrics["rejected"]) == (0, 0, 2, 1)
+    finally:
+        gate.set()
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_returns_result_and_propagates_errors():
+    executor = BoundedExecutor(max_workers=2, max_queue=0, retry_after=1, name="test")
+    try:
+        assert await executor.run(sum, [1, 2, 3]) == 6
+        with pytest.raises(ZeroDivisionError):
+            await executor.run(divmod, 1, 0)
+        assert executor.metrics()["completed"] == 2
+    finally:
+        executor.shutdown()
@@ -0,0 +1,56 @@
+import json
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from src.conf.config import settings
+from src.database.instrumentation import instrument, normalize_sql, current_route
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    instrument(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_normalize_sql_strips_literals_and_param_lists():
+    statement = """SELECT *  FROM contacts
+        WHERE contacts.user_id = $1 AND contacts.id IN ($2, $3, $4) AND first_name = 'O''Neil' LIMIT 10"""
+    assert normalize_sql(statement) == \
+        "SELECT * FROM contacts WHERE contacts.user_id = $1 AND contacts.id IN (...) AND first_name = ? LIMIT ?"
+
+
+def test_slow_query_is_logged(engine, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "db_slow_query_ms", 0)
+    monkeypatch.setattr(settings, "db_query_sample_rate", 0)
+    token = current_route.set("GET /api/contacts/contacts/{contact_id}")
+    try:
+        with caplog.at_level(logging.INFO, logger="src.database.queries"):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+    finally:
+        current_route.reset(token)
+    record = json.loads(caplog.records[-1].getMessage())
+    assert caplog.records[-1].levelno == logging.WARNING
+    assert record["event"] == "slow_query"
+    assert record["sql"] == "SELECT ?"
+    assert record["route"] == "GET /api/contacts/contacts/{contact_id}"
+    assert record["duration_ms"] >= 0
+
+
+def test_fast_query_is_skipped_unless_sampled(engine, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "db_slow_query_ms", 60_000)
+    monkeypatch.setattr(settings, "db_query_sample_rate", 0)
+    with caplog.at_level(logging.INFO, logger="src.database.queries"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    assert caplog.records == []
+
+    monkeypatch.setattr(settings, "db_query_sample_rate", 1)
+    with caplog.at_level(logging.INFO, logger="src.database.queries"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    assert json.loads(caplog.records[-1].getMessage())["event"] == "sampled_query"
@@ -0,0 +1,58 @@
+import pytest
+
+from src.services.ip_allowlist import IPAllowlistMiddleware, NetworkSet, parse_address
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def call(middleware, peer, forwarded_for=None):
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (peer, 1234)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages[0]["status"]
+
+
+def test_network_set_matches_prefixes():
+    networks = NetworkSet(["192.168.1.0/24", "172.16.0.0/12", "127.0.0.1", "2001:db8::/32"])
+    assert parse_address("192.168.1.77") in networks
+    assert parse_address("192.168.2.1") not in networks
+    assert parse_address("172.31.255.255") in networks
+    assert parse_address("172.32.0.1") not in networks
+    assert parse_address("127.0.0.1") in networks
+    assert parse_address("::ffff:127.0.0.1") in networks
+    assert parse_address("2001:db8:1::1") in networks
+    assert parse_address("2001:db9::1") not in networks
+    assert parse_address("testclient") is None
+
+
+@pytest.mark.asyncio
+async def test_denies_clients_outside_the_allowlist():
+    middleware = IPAllowlistMiddleware(app, allowed=["192.168.1.0/24"])
+    assert await call(middleware, "192.168.1.10") == 200
+    assert await call(middleware, "10.0.0.1") == 403
+    assert await call(middleware, "not an address") == 403
+    assert await call(middleware, "10.0.0.1", forwarded_for="192.168.1.10") == 403
+    assert await call(middleware, "10.0.0.1", forwarded_for="192.168.1.11") == 403
+    assert middleware.decisions.stats()["size"] == 3
+
+
+@pytest.mark.asyncio
+async def test_trusted_proxy_forwarded_for():
+    middleware = IPAllowlistMiddleware(app, allowed=["192.168.1.0/24"], trusted_proxies=["10.0.0.0/8"])
+    assert await call(middleware, "10.0.0.1", forwarded_for="192.168.1.10") == 200
+    assert await call(middleware, "10.0.0.1", forwarded_for="192.168.1.10, 10.0.0.2") == 200
+    assert await call(middleware, "10.0.0.1", forwarded_for="192.168.1.10, 8.8.8.8") == 403
+    assert await call(middleware, "10.0.0.1", forwarded_for="garbage") == 403
+    assert await call(middleware, "10.0.0.1") == 403
+    assert middleware.decisions.stats()["size"] == 6
@@ -0,0 +1,61 @@
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import JWTError, jwk, jwt
+
+from src.services.auth import auth_service
+from src.services.jwt_keys import KeyRing
+
+
+def private_pem() -> str:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption()).decode()
+
+
+@pytest.fixture(scope="module")
+def pems():
+    return {"2024-01": private_pem(), "2024-06": private_pem()}
+
+
+def test_sign_and_verify_with_rotated_keys(tmp_path, pems):
+    for kid, pem in pems.items():
+        (tmp_path / f"{kid}.pem").write_text(pem)
+    ring = KeyRing.from_directory(str(tmp_path), "RS256")
+    assert ring.active_kid == "2024-06"
+
+    token = ring.sign({"sub": "deadpool@example.com"})
+    assert jwt.get_unverified_header(token)["kid"] == "2024-06"
+    assert ring.verify(token)["sub"] == "deadpool@example.com"
+
+    old_token = KeyRing("RS256", pems, "2024-01").sign({"sub": "deadpool@example.com"})
+    assert ring.verify(old_token)["sub"] == "deadpool@example.com"
+
+
+def test_rejects_unknown_kid(pems):
+    ring = KeyRing("RS256", {"2024-06": pems["2024-06"]}, "2024-06")
+    foreign = KeyRing("RS256", {"2024-01": pems["2024-01"]}, "2024-01").sign({"sub": "deadpool@example.com"})
+    with pytest.raises(JWTError):
+        ring.verify(foreign)
+    hs256 = jwt.encode({"sub": "deadpool@example.com"}, "secret", algorithm="HS256")
+    with pytest.raises(JWTError):
+        ring.verify(hs256)
+
+
+def test_jwks_verifies_tokens_without_private_parts(pems):
+    ring = KeyRing("RS256", pems, "2024-06")
+    token = ring.sign({"sub": "deadpool@example.com"})
+    keys = ring.jwks()["keys"]
+    assert {key["kid"] for key in keys} == {"2024-01", "2024-06"}
+    assert all("d" not in key for key in keys)
+    public = next(key for key in keys if key["kid"] == "2024-06")
+    assert jwt.decode(token, jwk.construct(public), algorithms=["RS256"])["sub"] == "deadpool@example.com"
+
+
+@pytest.mark.asyncio
+async def test_auth_signs_with_key_ring(monkeypatch, pems):
+    monkeypatch.setattr(auth_service, "key_ring", KeyRing("RS256", pems, "2024-06"))
+    token = await auth_service.create_refresh_token(data={"sub": "deadpool@example.com"})
+    assert jwt.get_unverified_header(token)["alg"] == "RS256"
+    assert await auth_service.decode_refresh_token(token) == "deadpool@example.com"
+    assert len(auth_service.jwks()["keys"]) == 2
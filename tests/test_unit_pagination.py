@@ -0,0 +1,67 @@
+from datetime import date
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+
+from src.database.models import ContactModel
+from src.routes.contacts import list_contacts
+from src.services.pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(123456)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == 123456
+
+
+@pytest.mark.parametrize("cursor", ["garbage", encode_cursor(1)[:-2], "eyJpZCI6ImEifQ"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as err:
+        decode_cursor(cursor)
+    assert err.value.status_code == 400
+
+
+@pytest_asyncio.fixture
+async def walk_pages(sqlite_session, sqlite_users):
+    owner, other = sqlite_users
+    # Inserted out of id order and interleaved with the contacts of another user
+    for contact_id in (7, 3, 9, 1, 5, 2, 8, 4, 6):
+        sqlite_session.add(ContactModel(id=contact_id, first_name=f"n{contact_id}", second_name="Doe",
+                                        email=f"{contact_id}@example.com", phone=f"{contact_id}",
+                                        birth_date=date(1990, 1, 1), user=owner if contact_id % 2 else other))
+    await sqlite_session.commit()
+
+    async def walk(limit: int, offset: int = 0, pages: int = 10):
+        result, cursor = [], None
+        for _ in range(pages):
+            page = await list_contacts(limit=limit, offset=offset, cursor=cursor, db=sqlite_session,
+                                       current_user=owner)
+            result.append(([contact.id for contact in page["items"]], page["next_cursor"]))
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        return result
+
+    return walk
+
+
+@pytest.mark.asyncio
+async def test_keyset_pages_cover_user_contacts_once_in_id_order(walk_pages):
+    pages = await walk_pages(limit=2)
+    assert [ids for ids, _ in pages] == [[1, 3], [5, 7], [9]]
+    assert [cursor is not None for _, cursor in pages] == [True, True, False]
+    assert decode_cursor(pages[0][1]) == 3
+
+
+@pytest.mark.asyncio
+async def test_last_full_page_has_no_cursor(walk_pages):
+    pages = await walk_pages(limit=5)
+    assert pages == [([1, 3, 5, 7, 9], None)]
+
+
+@pytest.mark.asyncio
+async def test_offset_only_applies_without_cursor(walk_pages):
+    pages = await walk_pages(limit=2, offset=1)
+    assert [ids for ids, _ in pages] == [[3, 5], [7, 9]]
+    assert pages[-1][1] is None
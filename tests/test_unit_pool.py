@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.pool import InstrumentedPool
+
+POOL_FIELDS = {"size", "checked_out", "idle", "overflow", "max_overflow", "checkouts", "timeouts", "wait_ms_total",
+               "wait_ms_avg", "wait_ms_max"}
+
+
+def test_pool_counts_checkouts_overflow_and_timeouts(tmp_path):
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedPool,
+                                     pool_size=1, max_overflow=1, pool_timeout=0.05)
+        pool = engine.pool
+        try:
+            first = await engine.connect()
+            second = await engine.connect()
+            busy = pool.metrics()
+            with pytest.raises(exc.TimeoutError):
+                await engine.connect()
+            await second.close()
+            await first.close()
+            return busy, pool.metrics()
+        finally:
+            await engine.dispose()
+
+    busy, idle = asyncio.run(run())
+    assert set(busy) == POOL_FIELDS
+    assert (busy["size"], busy["checked_out"], busy["overflow"], busy["max_overflow"]) == (1, 2, 1, 1)
+    assert busy["checkouts"] == 2
+    assert idle["checked_out"] == 0
+    assert idle["idle"] == 1
+    assert (idle["checkouts"], idle["timeouts"]) == (3, 1)
+    assert idle["wait_ms_max"] >= 50
+    assert idle["wait_ms_max"] >= idle["wait_ms_avg"] > 0
+
+
+def test_metrics_endpoint_reports_every_subsystem():
+    import main
+
+    metrics = asyncio.run(main.metrics())
+    assert set(metrics) == {"db_pool", "user_cache", "token_cache", "revocation", "password_hash"}
+    assert set(metrics["db_pool"]) == POOL_FIELDS
+    assert set(metrics["password_hash"]) == {"max_workers", "max_queue", "running", "queued", "completed", "rejected"}
+    assert set(metrics["revocation"]) == {"entries", "skipped", "lookups", "revoked_hits"}
@@ -1,10 +1,20 @@
 import asyncio
+import csv
+import io
 import unittest
-from datetime import datetime
-from unittest.mock import MagicMock
+from datetime import datetime, date
+from unittest.mock import MagicMock, AsyncMock
 
-from src.database.models import User, ContactModel
-from src.repository.contacts import (get_contacts, get_contact_by_id, create)
+import orjson
+import pytest
+import pytest_asyncio
+from sqlalchemy import event
+
+from src.database.models import User
+from src.database.models import ContactModel as Contact
+from src.repository.contacts import (get_contacts, get_contact_by_id, create, get_contacts_birthday, stream_contacts,
+                                     EXPORT_COLUMNS)
+from src.services.export import ndjson_chunks, csv_chunks
 from src.schemas import ContactModel
 
 
@@ -24,7 +34,7 @@ class TestContactManagement(unittest.TestCase):
 
     # def test_get_contacts(self):
     #     # Set up the mock for query
-    #     self.db.query.return_value.filter.return_value.limit.return_value.offset.return_value.all.return_value = [
+    #     self.db.execute.return_value.scalars.return_value.all.return_value = [
     #         self.contact]
     #
     #     
@@ -37,7 +47,7 @@ class TestContactManagement(unittest.TestCase):
 
     # def test_get_contact_by_id(self):
     #     
-    #     self.db.query.return_value.filter.return_value.first.return_value = self.contact
+    #     self.db.execute.return_value.scalars.return_value.first.return_value = self.contact
     #
     #    
     #     contact = asyncio.run(get_contact_by_id(1, self.user, self.db))
@@ -49,15 +59,104 @@ class TestContactManagement(unittest.TestCase):
         # Setup the mock
         contact_model = ContactModel(**self.contact_data)
         self.db.add = MagicMock()
-        self.db.commit = MagicMock()
-        self.db.refresh = MagicMock()
+        self.db.commit = AsyncMock()
+        self.db.refresh = AsyncMock()
 
        
         created_contact = asyncio.run(create(contact_model, self.user, self.db))
 
         # Assertions
         self.db.add.assert_called_once()
-        self.db.commit.assert_called_once()
-        self.db.refresh.assert_called_once_with(created_contact)
+        self.db.commit.assert_awaited_once()
+        self.db.refresh.assert_awaited_once_with(created_contact)
 
   
+
+
+BIRTHDAYS = {'new_year': date(1990, 1, 2), 'december': date(1985, 12, 30), 'leap': date(1992, 2, 29),
+             'march': date(1980, 3, 3), 'summer': date(1999, 7, 1)}
+
+
+@pytest_asyncio.fixture
+async def birthday_contacts(sqlite_session, sqlite_users):
+    for n, (name, birth_date) in enumerate(BIRTHDAYS.items()):
+        for owner in sqlite_users:
+            sqlite_session.add(Contact(first_name=name, second_name='Doe', email=f'{name}{owner.id}@example.com',
+                                       phone=f'{owner.id}{n}', birth_date=birth_date, user=owner))
+    await sqlite_session.commit()
+
+    async def query(start_date, end_date):
+        contacts = await get_contacts_birthday(start_date, end_date, sqlite_users[0], sqlite_session)
+        return [(contact.first_name, contact.user_id) for contact in contacts]
+
+    return query
+
+
+@pytest.mark.asyncio
+async def test_birthday_window_wraps_year_end_in_upcoming_order(birthday_contacts):
+    assert await birthday_contacts(date(2024, 12, 28), date(2025, 1, 4)) == [('december', 1), ('new_year', 1)]
+
+
+@pytest.mark.asyncio
+async def test_leap_day_birthday_on_non_leap_year(birthday_contacts):
+    assert await birthday_contacts(date(2025, 3, 1), date(2025, 3, 8)) == [('leap', 1), ('march', 1)]
+    assert await birthday_contacts(date(2025, 2, 21), date(2025, 2, 28)) == []
+
+
+@pytest.mark.asyncio
+async def test_listing_costs_fixed_number_of_queries(sqlite_session, sqlite_users):
+    owner, _ = sqlite_users
+    statements = []
+    event.listen(sqlite_session.bind.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    async def count_queries(contacts_count):
+        start = len(await get_contacts(100, 0, owner, sqlite_session))
+        sqlite_session.add_all([Contact(first_name=f'n{n}', second_name='Doe', email=f'{n}@example.com',
+                                        phone=f'{n}', birth_date=date(1990, 1, 1), user=owner)
+                                for n in range(start, contacts_count)])
+        await sqlite_session.commit()
+        # Start from an empty identity map, as a new request does
+        sqlite_session.expunge_all()
+        statements.clear()
+        contacts = await get_contacts(100, 0, owner, sqlite_session)
+        assert {contact.user.email for contact in contacts} == {'owner@example.com'}
+        return len(statements)
+
+    assert await count_queries(3) == 2
+    assert await count_queries(30) == 2
+
+
+@pytest_asyncio.fixture
+async def export(sqlite_session, sqlite_users):
+    for n in range(5):
+        for owner in sqlite_users:
+            sqlite_session.add(Contact(first_name=f'First{n}', second_name='Doe, Jr.',
+                                       email=f'c{n}{owner.id}@example.com', phone=f'{owner.id}{n}',
+                                       birth_date=date(1990, 1, n + 1), user=owner))
+    await sqlite_session.commit()
+
+    async def run(encode, batch_size):
+        return [chunk async for chunk in encode(stream_contacts(sqlite_users[0], sqlite_session, batch_size=batch_size),
+                                                EXPORT_COLUMNS)]
+
+    return run
+
+
+@pytest.mark.asyncio
+async def test_ndjson_streams_user_contacts_in_batches(export):
+    chunks = await export(ndjson_chunks, batch_size=2)
+    assert len(chunks) == 3
+    rows = [orjson.loads(line) for line in b"".join(chunks).splitlines()]
+    assert [row["email"] for row in rows] == [f'c{n}1@example.com' for n in range(5)]
+    assert rows[0]["birth_date"] == "1990-01-01"
+    assert list(rows[0]) == list(EXPORT_COLUMNS)
+
+
+@pytest.mark.asyncio
+async def test_csv_has_header_and_quotes_values(export):
+    chunks = await export(csv_chunks, batch_size=10)
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+    assert rows[0] == list(EXPORT_COLUMNS)
+    assert len(rows) == 6
+    assert rows[1][2] == 'Doe, Jr.'
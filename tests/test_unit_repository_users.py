@@ -1,20 +1,30 @@
 import pytest
 from unittest.mock import MagicMock, AsyncMock
-from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
-from src.repository.users import get_user_by_email, create_user, update_token, confirmed_email, update_avatar
+from src.services.cache import CachedUser
+from src.repository.users import get_user_by_email, create_user, confirmed_email, update_avatar, update_password
 
 
 @pytest.fixture
 def mock_db_session():
     # Create a mock database session
-    session = MagicMock(spec=Session)
-    session.query.return_value.filter_by.return_value.first = MagicMock()
+    session = AsyncMock(spec=AsyncSession)
+    session.add = MagicMock()
+    session.execute.return_value.scalars = MagicMock()
     return session
 
 
+@pytest.fixture(autouse=True)
+def mock_user_cache(monkeypatch):
+    mock = MagicMock(evict=AsyncMock(), write_through=AsyncMock())
+    monkeypatch.setattr("src.repository.users.user_cache", mock)
+    return mock
+
+
 @pytest.fixture
 def mock_user():
     return User(id=1, email='user@example.com', confirmed=False)
@@ -22,15 +32,15 @@ def mock_user():
 
 @pytest.mark.asyncio
 async def test_get_user_by_email_found(mock_db_session, mock_user):
-    mock_db_session.query.return_value.filter_by.return_value.first.return_value = mock_user
+    mock_db_session.execute.return_value.scalars.return_value.first.return_value = mock_user
     user = await get_user_by_email('user@example.com', mock_db_session)
     assert user == mock_user
-    mock_db_session.query.assert_called_with(User)
+    mock_db_session.execute.assert_awaited_once()
 
 
 @pytest.mark.asyncio
 async def test_get_user_by_email_not_found(mock_db_session):
-    mock_db_session.query.return_value.filter_by.return_value.first.return_value = None
+    mock_db_session.execute.return_value.scalars.return_value.first.return_value = None
     user = await get_user_by_email('nonexistent@example.com', mock_db_session)
     assert user is None
 
@@ -45,24 +55,49 @@ async def test_create_user(mock_db_session):
 
 
 @pytest.mark.asyncio
-async def test_update_token(mock_db_session, mock_user):
-    await update_token(mock_user, 'new_token', mock_db_session)
-    assert mock_user.refresh_token == 'new_token'
-    assert mock_db_session.commit.called
-
-
-@pytest.mark.asyncio
-async def test_confirmed_email(mock_db_session, mock_user):
-    mock_db_session.query.return_value.filter_by.return_value.first.return_value = mock_user
+async def test_confirmed_email(mock_db_session, mock_user, mock_user_cache):
+    mock_db_session.execute.return_value.scalars.return_value.first.return_value = mock_user
     await confirmed_email(mock_user.email, mock_db_session)
     assert mock_user.confirmed is True
     assert mock_db_session.commit.called
+    mock_user_cache.write_through.assert_awaited_once_with(CachedUser.from_user(mock_user))
 
 
 @pytest.mark.asyncio
-async def test_update_avatar(mock_db_session, mock_user):
-    mock_db_session.query.return_value.filter_by.return_value.first.return_value = mock_user
+async def test_update_avatar(mock_db_session, mock_user, mock_user_cache):
+    mock_db_session.execute.return_value.scalars.return_value.first.return_value = mock_user
     new_avatar_url = 'http://example.com/newavatar.jpg'
     updated_user = await update_avatar(mock_user.email, new_avatar_url, mock_db_session)
     assert updated_user.avatar == new_avatar_url
     assert mock_db_session.commit.called
+    mock_user_cache.write_through.assert_awaited_once_with(CachedUser.from_user(mock_user))
+
+
+@pytest.mark.asyncio
+async def test_cache_is_evicted_before_commit(mock_db_session, mock_user, mock_user_cache):
+    calls = []
+    mock_user_cache.evict.side_effect = lambda email: calls.append(("evict", email))
+    mock_db_session.commit.side_effect = lambda: calls.append(("commit",))
+    mock_user_cache.write_through.side_effect = lambda user: calls.append(("write_through", user.avatar))
+    mock_db_session.execute.return_value.scalars.return_value.first.return_value = mock_user
+    await update_avatar(mock_user.email, 'http://example.com/newavatar.jpg', mock_db_session)
+    assert calls == [("evict", "user@example.com"), ("commit",), ("write_through", "http://example.com/newavatar.jpg")]
+
+
+@pytest.mark.asyncio
+async def test_commit_is_skipped_when_cache_is_unreachable(mock_db_session, mock_user, mock_user_cache):
+    mock_user_cache.evict.side_effect = RedisError("down")
+    mock_db_session.execute.return_value.scalars.return_value.first.return_value = mock_user
+    with pytest.raises(RedisError):
+        await confirmed_email(mock_user.email, mock_db_session)
+    mock_db_session.commit.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_update_password(mock_db_session):
+    mock_db_session.execute.return_value.rowcount = 1
+    assert await update_password('user@example.com', 'old_hash', 'new_hash', mock_db_session) is True
+    statement = mock_db_session.execute.await_args.args[0]
+    assert statement.compile().params == {'email_1': 'user@example.com', 'password_1': 'old_hash',
+                                          'password': 'new_hash'}
+    mock_db_session.commit.assert_awaited_once()
@@ -0,0 +1,87 @@
+import time
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from src.services.revocation import BloomFilter, RevocationList
+
+
+@pytest.fixture
+def mock_redis():
+    mock = AsyncMock()
+    mock.register_script = MagicMock(side_effect=lambda script: AsyncMock())
+    return mock
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    members = [uuid.uuid4().hex for _ in range(1000)]
+    for member in members:
+        bloom.add(member)
+    assert all(member in bloom for member in members)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+    assert false_positives < 300
+
+
+@pytest.mark.asyncio
+async def test_unrevoked_token_is_checked_without_redis(mock_redis):
+    revocations = RevocationList(mock_redis, capacity=100, error_rate=0.001, sync_interval=5)
+    assert await revocations.is_revoked("jti") is False
+    mock_redis.exists.assert_not_awaited()
+    assert revocations.stats()["skipped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_revoke_until_expiry(mock_redis):
+    revocations = RevocationList(mock_redis, capacity=100, error_rate=0.001, sync_interval=5)
+    expires_at = time.time() + 600
+    await revocations.revoke("jti", expires_at)
+    call = revocations._revoke.call_args.kwargs
+    assert call["keys"] == ["revoked:jti", RevocationList.INDEX_KEY, RevocationList.LOG_KEY,
+                            RevocationList.SEQUENCE_KEY]
+    assert call["args"][:2] == ["jti", expires_at] and 599 <= call["args"][2] <= 600
+
+    mock_redis.exists.return_value = 1
+    assert await revocations.is_revoked("jti") is True
+    mock_redis.exists.assert_awaited_once_with("revoked:jti")
+
+
+@pytest.mark.asyncio
+async def test_sync_rebuilds_filter_from_log(mock_redis):
+    revocations = RevocationList(mock_redis, capacity=100, error_rate=0.001, sync_interval=5)
+    revocations.bloom.add("expired")
+    revocations._prune.return_value = [b"other-worker", b"3"]
+    await revocations.sync()
+    assert "other-worker" in revocations.bloom
+    assert "expired" not in revocations.bloom
+    assert revocations._prune.call_args.kwargs["keys"] == [RevocationList.INDEX_KEY, RevocationList.LOG_KEY]
+
+
+@pytest.mark.asyncio
+async def test_sync_reads_only_new_log_entries(mock_redis):
+    revocations = RevocationList(mock_redis, capacity=100, error_rate=0.001, sync_interval=5, rebuild_every=2)
+    revocations._prune.return_value = [b"first", b"3"]
+    await revocations.sync()
+    mock_redis.zrangebyscore.return_value = [(b"second", 4.0), (b"third", 5.0)]
+    await revocations.sync()
+    mock_redis.zrangebyscore.assert_awaited_once_with(RevocationList.LOG_KEY, "(3.0", "+inf", withscores=True)
+    assert all(jti in revocations.bloom for jti in ("first", "second", "third"))
+    mock_redis.zrangebyscore.return_value = []
+    await revocations.sync()
+    assert mock_redis.zrangebyscore.call_args.args[1] == "(5.0"
+    await revocations.sync()
+    assert revocations._prune.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_rebuild_keeps_tokens_revoked_while_reading_the_log(mock_redis):
+    revocations = RevocationList(mock_redis, capacity=100, error_rate=0.001, sync_interval=5)
+
+    async def prune(**kwargs):
+        await revocations.revoke("during-sync", time.time() + 600)
+        return []
+
+    revocations._prune.side_effect = prune
+    await revocations.sync()
+    assert "during-sync" in revocations.bloom
@@ -0,0 +1,285 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from redis.exceptions import RedisError
+from fastapi import HTTPException
+from jose import jwt
+from passlib.hash import bcrypt
+
+from src.database.models import User
+from src.services.auth import auth_service, _make_pwd_context
+from src.services.cache import CachedUser, user_cache
+from src.services.lru import TTLCache
+from src.services.refresh_tokens import RefreshTokenStore, Rotation
+
+
+@pytest.fixture
+def mock_redis(monkeypatch):
+    mock = AsyncMock()
+    mock.get.return_value = None
+    mock.evalsha.return_value = 1
+    monkeypatch.setattr(user_cache, "redis", mock)
+    monkeypatch.setattr(user_cache, "local", TTLCache(maxsize=2, ttl=30))
+    return mock
+
+
+@pytest.fixture
+def mock_get_user_by_email(monkeypatch):
+    mock = AsyncMock(return_value=User(id=1, username="deadpool", email="deadpool@example.com", password="hash",
+                                       avatar="avatar", confirmed=True))
+    monkeypatch.setattr("src.repository.users.get_user_by_email", mock)
+    return mock
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_cache_miss(mock_redis, mock_get_user_by_email):
+    token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+    user = await auth_service.get_current_user(token, AsyncMock())
+    assert user == CachedUser(id=1, username="deadpool", email="deadpool@example.com", avatar="avatar", confirmed=True)
+    mock_get_user_by_email.assert_awaited_once()
+    mock_redis.get.assert_any_await("user:gen:deadpool@example.com")
+    mock_redis.evalsha.assert_awaited_once_with(user_cache._set_if_current.sha, 2, "user:deadpool@example.com",
+                                                "user:gen:deadpool@example.com", 0, user.dumps(), user_cache.ttl)
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_cache_hit(mock_redis, mock_get_user_by_email):
+    mock_redis.get.return_value = CachedUser(id=1, username="deadpool", email="deadpool@example.com", avatar=None,
+                                             confirmed=True).dumps()
+    token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+    user = await auth_service.get_current_user(token, AsyncMock())
+    assert user.email == "deadpool@example.com"
+    mock_get_user_by_email.assert_not_awaited()
+    mock_redis.set.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_rejects_refresh_token(mock_redis, mock_get_user_by_email):
+    token = await auth_service.create_refresh_token(data={"sub": "deadpool@example.com"})
+    with pytest.raises(HTTPException) as err:
+        await auth_service.get_current_user(token, AsyncMock())
+    assert err.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_ignores_stale_cache_entry(mock_redis, mock_get_user_by_email):
+    entries = {"user:deadpool@example.com": b"\x80\x04\x95legacy pickle"}
+    mock_redis.get.side_effect = entries.get
+    token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+    user = await auth_service.get_current_user(token, AsyncMock())
+    assert user.email == "deadpool@example.com"
+    mock_get_user_by_email.assert_awaited_once()
+
+
+def test_cached_user_versioning():
+    user = CachedUser(id=1, username="deadpool", email="deadpool@example.com", avatar=None, confirmed=False)
+    assert CachedUser.loads(user.dumps()) == user
+    assert CachedUser.loads(b"[0,1,\"deadpool\",\"deadpool@example.com\",null,false]") is None
+    assert "password" not in user.dumps().decode()
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_local_hit(mock_redis, mock_get_user_by_email):
+    token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+    await auth_service.get_current_user(token, AsyncMock())
+    user = await auth_service.get_current_user(token, AsyncMock())
+    assert user.email == "deadpool@example.com"
+    mock_get_user_by_email.assert_awaited_once()
+    # The principal and the generation, both read by the first request only
+    assert mock_redis.get.await_count == 2
+    assert user_cache.local.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_user_cache_invalidate(mock_redis):
+    user_cache.local.set("deadpool@example.com", object())
+    await user_cache.invalidate("deadpool@example.com")
+    assert user_cache.local.get("deadpool@example.com") is None
+    mock_redis.evalsha.assert_awaited_once_with(user_cache._bump.sha, 2, "user:deadpool@example.com",
+                                                "user:gen:deadpool@example.com", user_cache.ttl)
+    mock_redis.publish.assert_awaited_once_with(user_cache.INVALIDATION_CHANNEL, "deadpool@example.com")
+
+
+@pytest.mark.asyncio
+async def test_user_cache_write_through_failure_evicts(mock_redis):
+    user = CachedUser(id=1, username="deadpool", email="deadpool@example.com", avatar=None, confirmed=True)
+    mock_redis.evalsha.side_effect = RedisError("down")
+    await user_cache.write_through(user)
+    assert user_cache.local.get("deadpool@example.com") is None
+    mock_redis.delete.assert_awaited_once_with("user:deadpool@example.com")
+
+
+class FencedRedis:
+    """Just enough of Redis to run the two user cache scripts."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def publish(self, channel, message):
+        pass
+
+    async def evalsha(self, sha, numkeys, key, generation_key, *args):
+        generation = int(self.data.get(generation_key) or 0)
+        if sha == user_cache._set_if_current.sha:
+            if generation != args[0]:
+                return 0
+            self.data[key] = args[1]
+            return 1
+        self.data[generation_key] = generation + 1
+        if len(args) > 1:
+            self.data[key] = args[1]
+        else:
+            self.data.pop(key, None)
+        return generation + 1
+
+
+@pytest.mark.asyncio
+async def test_user_cache_keeps_committed_state_over_stale_read(monkeypatch):
+    monkeypatch.setattr(user_cache, "redis", FencedRedis())
+    monkeypatch.setattr(user_cache, "local", TTLCache(maxsize=2, ttl=30))
+    old = CachedUser(id=1, username="deadpool", email="deadpool@example.com", avatar="old", confirmed=True)
+    new = CachedUser(id=1, username="deadpool", email="deadpool@example.com", avatar="new", confirmed=True)
+
+    await user_cache.evict(old.email)
+    # A request misses the cache and reads the row before the writer commits
+    generation = await user_cache.generation(old.email)
+    await user_cache.write_through(new)
+    assert not await user_cache.set(old, generation)
+    user_cache.local.clear()
+    assert await user_cache.get(old.email) == new
+
+    generation = await user_cache.generation(new.email)
+    assert await user_cache.set(new, generation)
+
+
+@pytest.mark.asyncio
+async def test_rehash_outdated_password(monkeypatch):
+    monkeypatch.setattr(auth_service, "pwd_context", _make_pwd_context(5))
+    outdated = bcrypt.using(rounds=4).hash("secret")
+    assert auth_service.needs_rehash(outdated)
+    assert not auth_service.needs_rehash(await auth_service.get_password_hash("secret"))
+
+    session = AsyncMock()
+    monkeypatch.setattr("src.services.auth.DBSession", MagicMock(return_value=session))
+    update_password = AsyncMock()
+    monkeypatch.setattr("src.repository.users.update_password", update_password)
+    await auth_service.rehash_password("deadpool@example.com", "secret", outdated)
+    email, old_hash, new_hash, db = update_password.await_args.args
+    assert (email, old_hash, db) == ("deadpool@example.com", outdated, session.__aenter__.return_value)
+    assert new_hash.startswith("$2b$05$") and await auth_service.verify_password("secret", new_hash)
+
+
+@pytest.mark.asyncio
+async def test_calibrate_hashing_stays_within_bounds(monkeypatch):
+    monkeypatch.setattr(auth_service, "pwd_context", auth_service.pwd_context)
+    assert await auth_service.calibrate_hashing(0, 4, 6) == 4
+    assert await auth_service.calibrate_hashing(10_000, 4, 6) == 6
+    assert (await auth_service.get_password_hash("secret")).startswith("$2b$06$")
+
+
+def test_decode_access_token_is_cached(monkeypatch):
+    monkeypatch.setattr(auth_service, "token_cache", TTLCache(maxsize=2))
+    token = asyncio.run(auth_service.create_access_token(data={"sub": "deadpool@example.com"}))
+    assert auth_service.decode_access_token(token).sub == "deadpool@example.com"
+    decode = MagicMock(side_effect=AssertionError("token verified twice"))
+    monkeypatch.setattr("src.services.auth.jwt.decode", decode)
+    assert auth_service.decode_access_token(token).sub == "deadpool@example.com"
+    assert auth_service.token_cache.hits == 1
+
+
+def test_decode_access_token_honours_expiry(monkeypatch):
+    monkeypatch.setattr(auth_service, "token_cache", TTLCache(maxsize=2))
+    token = asyncio.run(auth_service.create_access_token(data={"sub": "deadpool@example.com"}))
+    assert auth_service.decode_access_token(token).sub == "deadpool@example.com"
+    expired_at = time.time() + 16 * 60
+    monkeypatch.setattr("src.services.auth.time.time", lambda: expired_at)
+    assert auth_service.decode_access_token(token) is None
+    refresh_token = asyncio.run(auth_service.create_refresh_token(data={"sub": "deadpool@example.com"}))
+    assert auth_service.decode_access_token(refresh_token) is None
+    assert len(auth_service.token_cache) == 1
+
+
+@pytest.fixture
+def mock_refresh_tokens(monkeypatch):
+    mock = AsyncMock()
+    mock.new_id = MagicMock(return_value="next-jti")
+    mock.issue.return_value = ("family", "first-jti")
+    monkeypatch.setattr(auth_service, "refresh_tokens", mock)
+    return mock
+
+
+@pytest.mark.asyncio
+async def test_rotate_refresh_token(mock_refresh_tokens):
+    mock_refresh_tokens.rotate.return_value = Rotation.ROTATED
+    family, token = await auth_service.issue_refresh_token("deadpool@example.com")
+    assert family == jwt.get_unverified_claims(token)["fam"] == "family"
+    email, family, next_token = await auth_service.rotate_refresh_token(token)
+    assert (email, family) == ("deadpool@example.com", "family")
+    mock_refresh_tokens.rotate.assert_awaited_once_with("deadpool@example.com", "family", "first-jti", "next-jti")
+    claims = jwt.get_unverified_claims(next_token)
+    assert (claims["fam"], claims["jti"], claims["scope"]) == ("family", "next-jti", "refresh_token")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("rotation", [Rotation.REUSED, Rotation.UNKNOWN])
+async def test_rotate_refresh_token_rejects_used_or_revoked(mock_refresh_tokens, rotation):
+    mock_refresh_tokens.rotate.return_value = rotation
+    _, token = await auth_service.issue_refresh_token("deadpool@example.com")
+    with pytest.raises(HTTPException) as err:
+        await auth_service.rotate_refresh_token(token)
+    assert err.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_rotate_refresh_token_rejects_token_without_session(mock_refresh_tokens):
+    token = await auth_service.create_refresh_token(data={"sub": "deadpool@example.com"})
+    with pytest.raises(HTTPException) as err:
+        await auth_service.rotate_refresh_token(token)
+    assert err.value.status_code == 401
+    mock_refresh_tokens.rotate.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_logout_revokes_token_and_session(monkeypatch, mock_redis, mock_get_user_by_email, mock_refresh_tokens):
+    revocations = AsyncMock()
+    revocations.is_revoked.return_value = True
+    monkeypatch.setattr(auth_service, "revocations", revocations)
+    token = await auth_service.create_access_token(data={"sub": "deadpool@example.com", "fam": "family"})
+    claims = auth_service.decode_access_token(token)
+
+    await auth_service.logout(token)
+    revocations.revoke.assert_awaited_once_with(claims.jti, claims.exp)
+    mock_refresh_tokens.revoke.assert_awaited_once_with("deadpool@example.com", "family")
+
+    with pytest.raises(HTTPException) as err:
+        await auth_service.get_current_user(token, AsyncMock())
+    assert err.value.status_code == 401
+    revocations.is_revoked.assert_awaited_once_with(claims.jti)
+
+
+@pytest.mark.asyncio
+async def test_logout_all_revokes_token_and_every_session(monkeypatch, mock_refresh_tokens):
+    revocations = AsyncMock()
+    monkeypatch.setattr(auth_service, "revocations", revocations)
+    token = await auth_service.create_access_token(data={"sub": "deadpool@example.com", "fam": "family"})
+    claims = auth_service.decode_access_token(token)
+
+    await auth_service.logout_all(token)
+    revocations.revoke.assert_awaited_once_with(claims.jti, claims.exp)
+    mock_refresh_tokens.revoke_all.assert_awaited_once_with("deadpool@example.com")
+    mock_refresh_tokens.revoke.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_rotation_keeps_user_sessions_in_step():
+    client = MagicMock()
+    client.register_script.return_value = AsyncMock(return_value=-1)
+    store = RefreshTokenStore(client, ttl=60)
+    assert await store.rotate("deadpool@example.com", "family", "old-jti", "next-jti") is Rotation.REUSED
+    store._rotate.assert_awaited_once_with(keys=["refresh:family", "refresh:user:deadpool@example.com"],
+                                           args=["old-jti", "next-jti", 60, "family"])